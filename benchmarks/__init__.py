@@ -0,0 +1,12 @@
+r"""Benchmarks
+==============
+
+Benchmark linters, completers and the editing path of
+:class:`~lsp_tree_sitter.server.TreeSitterLanguageServer` with synthetic
+documents of a stand-in grammar, JSON.
+
+.. code-block:: sh
+
+    python -m benchmarks --output before.json
+    python -m benchmarks --compare before.json
+"""
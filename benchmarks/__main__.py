@@ -0,0 +1,202 @@
+r"""Run benchmarks, save the results as JSON and compare them with the
+results of another commit.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from importlib.metadata import PackageNotFoundError, version
+from itertools import groupby
+from math import log
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from .generators import SHAPES, generate_document
+from .suite import BENCHMARKS, benchmark
+
+
+def get_parser() -> ArgumentParser:
+    r"""Get a parser.
+
+    :rtype: ArgumentParser
+    """
+    parser = ArgumentParser("benchmarks")
+    parser.add_argument(
+        "--benchmark",
+        nargs="*",
+        choices=BENCHMARKS,
+        default=BENCHMARKS,
+        help="benchmarks to run. default: %(default)s",
+    )
+    parser.add_argument(
+        "--shape",
+        nargs="*",
+        choices=SHAPES,
+        default=SHAPES,
+        help="shapes of documents. default: %(default)s",
+    )
+    parser.add_argument(
+        "--size",
+        nargs="*",
+        type=int,
+        default=[50, 100, 200, 400],
+        help="leaves of documents. default: %(default)s",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="repeat each benchmark. default: %(default)s",
+    )
+    parser.add_argument(
+        "--output",
+        default="",
+        help="save results to a JSON file. default: stdout",
+    )
+    parser.add_argument(
+        "--compare",
+        default="",
+        help="compare with results of a JSON file. default: %(default)s",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="report slower results than this ratio. default: %(default)s",
+    )
+    return parser
+
+
+def get_environment() -> dict[str, str]:
+    r"""Get the environment of results.
+
+    :rtype: dict[str, str]
+    """
+    environment = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+    for package in ("lsp-tree-sitter", "tree-sitter", "tree-sitter-json"):
+        try:
+            environment[package] = version(package)
+        except PackageNotFoundError:
+            environment[package] = ""
+    try:
+        environment["commit"] = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        environment["commit"] = ""
+    return environment
+
+
+def get_scaling(results: list[dict[str, Any]]) -> dict[str, float]:
+    r"""Get the exponent of seconds in bytes of each benchmark and shape by
+    least squares of their logarithms. 1 is linear.
+
+    :param results:
+    :type results: list[dict[str, Any]]
+    :rtype: dict[str, float]
+    """
+    scaling = {}
+    for key, group in groupby(
+        sorted(results, key=lambda x: (x["benchmark"], x["shape"])),
+        key=lambda x: f"{x['benchmark']}/{x['shape']}",
+    ):
+        points = [
+            (log(result["bytes"]), log(result["seconds"]))
+            for result in group
+            if result["seconds"] > 0
+        ]
+        if len(points) < 2:
+            continue
+        x_mean = sum(x for x, _ in points) / len(points)
+        y_mean = sum(y for _, y in points) / len(points)
+        variance = sum((x - x_mean) ** 2 for x, _ in points)
+        if variance == 0:
+            continue
+        scaling[key] = (
+            sum((x - x_mean) * (y - y_mean) for x, y in points) / variance
+        )
+    return scaling
+
+
+def compare(
+    results: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    threshold: float,
+) -> list[str]:
+    r"""Compare results with a baseline. Return regressions.
+
+    :param results:
+    :type results: list[dict[str, Any]]
+    :param baseline:
+    :type baseline: list[dict[str, Any]]
+    :param threshold:
+    :type threshold: float
+    :rtype: list[str]
+    """
+    old = {
+        (result["benchmark"], result["shape"], result["size"]): result
+        for result in baseline
+    }
+    regressions = []
+    for result in results:
+        key = result["benchmark"], result["shape"], result["size"]
+        if key not in old or old[key]["seconds"] <= 0:
+            continue
+        ratio = result["seconds"] / old[key]["seconds"]
+        line = "{}/{}/{}: {:.3g}s -> {:.3g}s ({:+.1%})".format(
+            *key, old[key]["seconds"], result["seconds"], ratio - 1
+        )
+        print(line, file=sys.stderr)
+        if ratio > 1 + threshold:
+            regressions += [line]
+    return regressions
+
+
+def main() -> None:
+    r"""Main.
+
+    :rtype: None
+    """
+    args = get_parser().parse_args()
+    results = []
+    with TemporaryDirectory() as directory:
+        for shape in args.shape:
+            for size in args.size:
+                text = generate_document(shape, size)
+                for result in benchmark(
+                    shape, size, text, args.benchmark, args.repeat, directory
+                ):
+                    print(
+                        "{benchmark}/{shape}/{size}: {seconds:.3g}s "
+                        "{throughput:.3g}B/s".format(**result),
+                        file=sys.stderr,
+                    )
+                    results += [result]
+    output = {
+        "environment": get_environment(),
+        "results": results,
+        "scaling": get_scaling(results),
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("regressions:", *regressions, sep="\n", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
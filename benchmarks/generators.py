@@ -0,0 +1,105 @@
+r"""Generators
+==============
+
+Generate synthetic JSON documents of parameterised size and shape. The same
+size, shape and seed always generate the same document.
+"""
+
+import json
+from random import Random
+from typing import Any
+
+SHAPES = ("flat", "nested", "array")
+
+
+def generate_value(random: Random, index: int) -> Any:
+    r"""Generate a leaf value. Some paths don't exist and some strings are
+    too long for the schema, so linters report errors.
+
+    :param random:
+    :type random: Random
+    :param index:
+    :type index: int
+    :rtype: Any
+    """
+    match random.randrange(4):
+        case 0:
+            return random.choice(["/tmp", "/usr", f"/nonexistent/{index}"])
+        case 1:
+            return random.randrange(1000)
+        case 2:
+            return "x" * random.randrange(32)
+        case _:
+            return random.random() < 0.5
+
+
+def generate_object(random: Random, size: int, offset: int = 0) -> dict:
+    r"""Generate an object of ``size`` leaves.
+
+    :param random:
+    :type random: Random
+    :param size:
+    :type size: int
+    :param offset: the index of the first key
+    :type offset: int
+    :rtype: dict
+    """
+    return {
+        f"key{index}": generate_value(random, index)
+        for index in range(offset, offset + size)
+    }
+
+
+def generate_document(shape: str, size: int, seed: int = 0) -> str:
+    r"""Generate a document of about ``size`` leaves, one leaf per line.
+
+    ``flat`` is an object of leaves. ``nested`` is a chain of objects of 10
+    leaves. ``array`` is an array of objects of 5 leaves.
+
+    :param shape:
+    :type shape: str
+    :param size:
+    :type size: int
+    :param seed:
+    :type seed: int
+    :rtype: str
+    """
+    random = Random(seed)
+    match shape:
+        case "flat":
+            document: Any = generate_object(random, size)
+        case "nested":
+            document = {}
+            child = document
+            for offset in range(0, size, 10):
+                child.update(generate_object(random, 10, offset))
+                child["child"] = {}
+                child = child["child"]
+        case "array":
+            document = [
+                generate_object(random, 5, offset)
+                for offset in range(0, size, 5)
+            ]
+        case _:
+            raise ValueError(f"unknown shape: {shape}")
+    return json.dumps(document, indent=2) + "\n"
+
+
+def generate_schema(size: int) -> dict[str, Any]:
+    r"""Generate a schema for the keys of documents of ``size`` leaves.
+
+    :param size:
+    :type size: int
+    :rtype: dict[str, Any]
+    """
+    return {
+        "type": "object",
+        "properties": {
+            f"key{index}": {
+                "description": f"The key {index}.",
+                "type": "string",
+                "maxLength": 24,
+            }
+            for index in range(size)
+        },
+    }
@@ -0,0 +1,270 @@
+r"""Suite
+=========
+
+Benchmarks of a stand-in language server for JSON. Each benchmark returns the
+seconds of one operation on a document.
+"""
+
+import os
+from collections.abc import Callable
+from statistics import median
+from time import perf_counter
+from typing import Any
+
+from lsprotocol.types import (
+    TEXT_DOCUMENT_DID_CHANGE,
+    TEXT_DOCUMENT_DID_OPEN,
+    DidChangeTextDocumentParams,
+    DidOpenTextDocumentParams,
+    Position,
+    PublishDiagnosticsParams,
+    Range,
+    TextDocumentContentChangePartial,
+    TextDocumentItem,
+    VersionedTextDocumentIdentifier,
+)
+from pygls.uris import from_fs_path
+from tree_sitter import Language, Node, Parser, Query, Tree
+
+from lsp_tree_sitter.completer import SchemaCompleter
+from lsp_tree_sitter.linter import PathLinter, SchemaLinter
+from lsp_tree_sitter.server import TreeSitterLanguageServer
+
+from .generators import generate_schema
+
+BENCHMARKS = ("lint", "instantiate", "complete", "hover", "didChange")
+PATH_QUERY = "(string (string_content) @string.special.path)"
+SCHEMA_QUERY = "(pair key: (string (string_content) @--key) value: (_) @-key)"
+COMPLETER_CODE = r"""
+.properties | to_entries[]
+| select(
+    if $complete then .key | startswith($nodes[0].text)
+    else .key == $nodes[0].text end
+)
+| {
+    label: .key,
+    insert_text: .key,
+    kind: $enums.CompletionItemKind.Property,
+    documentation: {
+        kind: $enums.MarkupKind.PlainText,
+        value: .value.description
+    }
+}
+"""
+
+
+class BenchmarkLanguageServer(TreeSitterLanguageServer):
+    r"""Benchmark language server. It has no client."""
+
+    def text_document_publish_diagnostics(
+        self, params: PublishDiagnosticsParams
+    ) -> None:
+        r"""Drop diagnostics.
+
+        :param self:
+        :param params:
+        :type params: PublishDiagnosticsParams
+        :rtype: None
+        """
+
+
+def get_server(size: int) -> BenchmarkLanguageServer:
+    r"""Get a server linting and completing documents of ``size`` leaves.
+
+    :param size:
+    :type size: int
+    :rtype: BenchmarkLanguageServer
+    """
+    import tree_sitter_json
+
+    language = Language(tree_sitter_json.language())
+    schema = generate_schema(size)
+    linters = [
+        PathLinter(Query(language, PATH_QUERY)),
+        SchemaLinter.from_schema(
+            Query(language, SCHEMA_QUERY), lambda _: schema
+        ),
+    ]
+    completers = [SchemaCompleter(COMPLETER_CODE, lambda _: schema)]
+    return BenchmarkLanguageServer(
+        Parser(language), linters, completers, version="0"
+    )
+
+
+def get_positions(tree: Tree, number: int = 20) -> list[Position]:
+    r"""Get the positions of evenly spaced keys. Characters are after the
+    first character of keys.
+
+    :param tree:
+    :type tree: Tree
+    :param number:
+    :type number: int
+    :rtype: list[Position]
+    """
+    nodes: list[Node] = []
+    stack = [tree.root_node]
+    while stack:
+        node = stack.pop()
+        key = node.child_by_field_name("key")
+        if node.type == "pair" and key is not None:
+            nodes += [key]
+        stack += reversed(node.named_children)
+    step = max(len(nodes) // number, 1)
+    positions = []
+    for node in nodes[::step][:number]:
+        # accessing Point.row breaks Node.text later in tree-sitter 0.26
+        row, column = tuple(node.start_point)
+        positions += [Position(row, column + 2)]
+    return positions
+
+
+def run(
+    server: BenchmarkLanguageServer, path: str, text: str, benchmark: str
+) -> Callable[[], float]:
+    r"""Get a function to run a benchmark once. It returns the seconds of
+    one operation.
+
+    :param server:
+    :type server: BenchmarkLanguageServer
+    :param path: the file of the document
+    :type path: str
+    :param text: the document
+    :type text: str
+    :param benchmark: one of :data:`BENCHMARKS`
+    :type benchmark: str
+    :rtype: Callable[[], float]
+    """
+    match benchmark:
+        case "lint":
+
+            def operate() -> Any:
+                return server.lint(path)
+
+        case "instantiate":
+
+            def operate() -> Any:
+                return server.instantiate(path)
+
+        case "complete" | "hover":
+            tree = server.parsers.parse(text.encode())
+            positions = get_positions(tree)
+            completer = server.completers[0]
+            method = getattr(completer, benchmark)
+
+            def operate() -> Any:
+                for position in positions:
+                    method(tree, position, path)
+
+            # seconds of one position
+            return lambda: time(operate) / len(positions)
+
+        case "didChange":
+            uri = from_fs_path(path) or path
+            lines = text.splitlines()
+            handle = server.protocol.fm.features[TEXT_DOCUMENT_DID_CHANGE]
+            handle_open = server.protocol.fm.features[TEXT_DOCUMENT_DID_OPEN]
+            number = 10
+
+            def operate() -> Any:
+                handle_open(
+                    DidOpenTextDocumentParams(
+                        TextDocumentItem(uri, "json", 0, text)
+                    )
+                )
+                start = perf_counter()
+                # type and delete a space in the middle of the document
+                for version in range(1, number + 1):
+                    line = len(lines) // 2
+                    character = len(lines[line]) - len(lines[line].lstrip())
+                    if version % 2:
+                        edit_range = Range(
+                            Position(line, character),
+                            Position(line, character),
+                        )
+                        change = " "
+                    else:
+                        edit_range = Range(
+                            Position(line, character),
+                            Position(line, character + 1),
+                        )
+                        change = ""
+                    handle(
+                        DidChangeTextDocumentParams(
+                            VersionedTextDocumentIdentifier(version, uri),
+                            [
+                                TextDocumentContentChangePartial(
+                                    edit_range, change
+                                )
+                            ],
+                        )
+                    )
+                return perf_counter() - start
+
+            # without an event loop, every change is linted immediately
+            return lambda: operate() / number
+
+        case _:
+            raise ValueError(f"unknown benchmark: {benchmark}")
+
+    return lambda: time(operate)
+
+
+def time(function: Callable[[], Any]) -> float:
+    r"""Time a function.
+
+    :param function:
+    :type function: Callable[[], Any]
+    :rtype: float
+    """
+    start = perf_counter()
+    function()
+    return perf_counter() - start
+
+
+def benchmark(
+    shape: str,
+    size: int,
+    text: str,
+    benchmarks: list[str],
+    repeat: int,
+    directory: str,
+) -> list[dict[str, Any]]:
+    r"""Run benchmarks for a document.
+
+    :param shape:
+    :type shape: str
+    :param size:
+    :type size: int
+    :param text: the document
+    :type text: str
+    :param benchmarks:
+    :type benchmarks: list[str]
+    :param repeat:
+    :type repeat: int
+    :param directory: save the document to it
+    :type directory: str
+    :rtype: list[dict[str, Any]]
+    """
+    path = os.path.join(directory, f"{shape}-{size}.json")
+    with open(path, "w") as f:
+        f.write(text)
+    server = get_server(size)
+    results = []
+    for name in benchmarks:
+        operate = run(server, path, text, name)
+        # warm up
+        operate()
+        seconds = [operate() for _ in range(repeat)]
+        results += [
+            {
+                "benchmark": name,
+                "shape": shape,
+                "size": size,
+                "bytes": len(text.encode()),
+                "seconds": median(seconds),
+                "min": min(seconds),
+                "throughput": len(text.encode()) / median(seconds),
+            }
+        ]
+    server.thread_pool.shutdown()
+    return results
@@ -79,6 +79,30 @@ def get_parser(version: str, *args, **kwargs):
         help="indent json, yaml. default: %(default)s",
     )
 
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="dump latency histograms to stderr at exit. default: %(default)s",
+    )
+
+    parser.add_argument(
+        "--record",
+        default="",
+        help="record received messages to a file. default: %(default)s",
+    ).complete = shtab.FILE  # type: ignore
+    parser.add_argument(
+        "--replay",
+        default="",
+        help="replay recorded messages and report latencies. "
+        "default: %(default)s",
+    ).complete = shtab.FILE  # type: ignore
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=0.0,
+        help="speed of replay. 0 means without waiting. default: %(default)s",
+    )
+
     # from pygls.cls import start_server
     parser.add_argument(
         "--tcp",
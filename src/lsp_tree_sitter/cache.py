@@ -0,0 +1,739 @@
+r"""Cache
+=========
+
+Cache results of documents, compiled programs and validators.
+"""
+
+import json
+import os
+import re
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from contextlib import suppress
+from copy import copy
+from dataclasses import dataclass, field
+from hashlib import sha256
+from threading import Lock
+from typing import Any, TypeVar
+
+import jq
+from jsonschema.protocols import Validator
+from jsonschema.validators import validator_for
+from lsprotocol.converters import get_converter
+from lsprotocol.types import Diagnostic, Position, Range
+from tree_sitter import Range as TreeRange
+
+from .metrics import metrics
+
+# start_byte, end_byte, start_point, end_point
+Region = tuple[int, int, tuple[int, int], tuple[int, int]]
+T = TypeVar("T")
+
+
+@dataclass
+class DiagnosticCache:
+    r"""Diagnostics of incremental linters and the regions changed after
+    them. The positions of diagnostics are shifted by edits.
+    """
+
+    # linter index -> diagnostics
+    diagnostics: dict[int, list[Diagnostic]] = field(default_factory=dict)
+    regions: list[Region] = field(default_factory=list)
+
+    def copy(self) -> "DiagnosticCache":
+        r"""Copy for other threads.
+
+        :param self:
+        :rtype: DiagnosticCache
+        """
+        return DiagnosticCache(dict(self.diagnostics), list(self.regions))
+
+    @staticmethod
+    def shift_point(
+        point: tuple[int, int], edit: dict, is_end: bool = False
+    ) -> tuple[int, int]:
+        r"""Shift a point by an edit. A point inside the edit is moved to the
+        start or the end of the new text.
+
+        :param point:
+        :type point: tuple[int, int]
+        :param edit: ``Tree.edit()`` kwargs
+        :type edit: dict
+        :param is_end:
+        :type is_end: bool
+        :rtype: tuple[int, int]
+        """
+        if point < edit["start_point"]:
+            return point
+        if point <= edit["old_end_point"]:
+            return edit["new_end_point"] if is_end else edit["start_point"]
+        row, column = point
+        old_row, old_column = edit["old_end_point"]
+        new_row, new_column = edit["new_end_point"]
+        if row == old_row:
+            return new_row, new_column + column - old_column
+        return row + new_row - old_row, column
+
+    @staticmethod
+    def shift_byte(byte: int, edit: dict, is_end: bool = False) -> int:
+        r"""Shift a byte offset by an edit. A byte offset inside the edit is
+        moved to the start or the end of the new text.
+
+        :param byte:
+        :type byte: int
+        :param edit: ``Tree.edit()`` kwargs
+        :type edit: dict
+        :param is_end:
+        :type is_end: bool
+        :rtype: int
+        """
+        if byte < edit["start_byte"]:
+            return byte
+        if byte <= edit["old_end_byte"]:
+            return edit["new_end_byte"] if is_end else edit["start_byte"]
+        return byte + edit["new_end_byte"] - edit["old_end_byte"]
+
+    @staticmethod
+    def touch(range: Range, region: Region) -> bool:
+        r"""Judge if a range intersects or is adjacent to a region.
+
+        :param range:
+        :type range: Range
+        :param region:
+        :type region: Region
+        :rtype: bool
+        """
+        _, _, start, end = region
+        return (range.start.line, range.start.character) <= end and start <= (
+            range.end.line,
+            range.end.character,
+        )
+
+    def edit(self, edit: dict) -> None:
+        r"""Shift diagnostics and regions by an edit, then add the edited
+        region. Diagnostics touching the edit are dropped.
+
+        :param self:
+        :param edit: ``Tree.edit()`` kwargs
+        :type edit: dict
+        :rtype: None
+        """
+        region = (
+            edit["start_byte"],
+            edit["old_end_byte"],
+            edit["start_point"],
+            edit["old_end_point"],
+        )
+        for index, diagnostics in self.diagnostics.items():
+            items = []
+            for diagnostic in diagnostics:
+                if self.touch(diagnostic.range, region):
+                    continue
+                range = diagnostic.range
+                start = self.shift_point(
+                    (range.start.line, range.start.character), edit
+                )
+                end = self.shift_point(
+                    (range.end.line, range.end.character), edit, True
+                )
+                # don't modify the diagnostics used by other threads
+                diagnostic = copy(diagnostic)
+                diagnostic.range = Range(Position(*start), Position(*end))
+                items += [diagnostic]
+            self.diagnostics[index] = items
+        self.regions = [
+            (
+                self.shift_byte(start_byte, edit),
+                self.shift_byte(end_byte, edit, True),
+                self.shift_point(start_point, edit),
+                self.shift_point(end_point, edit, True),
+            )
+            for start_byte, end_byte, start_point, end_point in self.regions
+        ] + [
+            (
+                edit["start_byte"],
+                edit["new_end_byte"],
+                edit["start_point"],
+                edit["new_end_point"],
+            )
+        ]
+
+    def add(self, ranges: list[TreeRange]) -> None:
+        r"""Add regions, such as ``Tree.changed_ranges()``.
+
+        :param self:
+        :param ranges:
+        :type ranges: list[TreeRange]
+        :rtype: None
+        """
+        self.regions += [
+            (
+                range.start_byte,
+                range.end_byte,
+                tuple(range.start_point),
+                tuple(range.end_point),
+            )
+            for range in ranges
+        ]
+
+    def get_byte_ranges(self) -> list[tuple[int, int]]:
+        r"""Get byte ranges to query the nodes touching regions.
+
+        :param self:
+        :rtype: list[tuple[int, int]]
+        """
+        return [
+            (max(start_byte - 1, 0), end_byte + 1)
+            for start_byte, end_byte, _, _ in self.regions
+        ]
+
+    def update(
+        self, index: int, diagnostics: list[Diagnostic]
+    ) -> list[Diagnostic]:
+        r"""Merge the cached diagnostics of a linter outside regions with its
+        diagnostics of the regions.
+
+        :param self:
+        :param index:
+        :type index: int
+        :param diagnostics: diagnostics of :meth:`get_byte_ranges`
+        :type diagnostics: list[Diagnostic]
+        :rtype: list[Diagnostic]
+        """
+        return [
+            diagnostic
+            for diagnostic in self.diagnostics[index]
+            if not any(
+                self.touch(diagnostic.range, region) for region in self.regions
+            )
+        ] + [
+            diagnostic
+            for diagnostic in diagnostics
+            if any(
+                self.touch(diagnostic.range, region) for region in self.regions
+            )
+        ]
+
+
+class ResultCache:
+    r"""Results of requests keyed by URI, document version and feature."""
+
+    def __init__(self) -> None:
+        r"""Init.
+
+        :param self:
+        :rtype: None
+        """
+        self.results: dict[str, dict[tuple[int | None, Hashable], Any]] = {}
+
+    def get(self, uri: str, version: int | None, key: Hashable) -> Any:
+        r"""Get a result. Return ``None`` if it isn't cached.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param version:
+        :type version: int | None
+        :param key: feature and other parameters
+        :type key: Hashable
+        :rtype: Any
+        """
+        return self.results.get(uri, {}).get((version, key))
+
+    def set(
+        self, uri: str, version: int | None, key: Hashable, result: Any
+    ) -> None:
+        r"""Set a result.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param version:
+        :type version: int | None
+        :param key: feature and other parameters
+        :type key: Hashable
+        :param result:
+        :rtype: None
+        """
+        self.results.setdefault(uri, {})[version, key] = result
+
+    def invalidate(self, uri: str) -> None:
+        r"""Invalidate all results of a URI.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: None
+        """
+        self.results.pop(uri, None)
+
+
+@dataclass
+class FileEntry:
+    r"""Diagnostics of a file with the stat and the hash of the file."""
+
+    mtime_ns: int
+    size: int
+    hash: str
+    # ``None`` means the diagnostics of the same hash are reused
+    diagnostics: list[Diagnostic] | None = None
+    # the files and directories which the diagnostics depend on
+    dependencies: list[str] = field(default_factory=list)
+    result_id: str = field(default="", compare=False)
+
+    def get_result_id(self) -> str:
+        r"""Get the result ID of workspace diagnostics. It depends on the
+        diagnostics, because they can change by other files without the
+        file.
+
+        :param self:
+        :rtype: str
+        """
+        if self.result_id == "":
+            diagnostics = get_converter().unstructure(self.diagnostics or [])
+            self.result_id = sha256(
+                (self.hash + json.dumps(diagnostics)).encode()
+            ).hexdigest()
+        return self.result_id
+
+
+class FileCache:
+    r"""Diagnostics of files persisted in a JSON file. An entry is reused
+    when the mtime and the size of its file are unchanged, or the hash of its
+    file is unchanged. Entries of other versions of the server are dropped.
+    """
+
+    def __init__(self, path: str = "", version: str = "") -> None:
+        r"""Init.
+
+        :param self:
+        :param path: don't persist entries if it is empty
+        :type path: str
+        :param version:
+        :type version: str
+        :rtype: None
+        """
+        self.path = path
+        self.version = version
+        self.entries: dict[str, FileEntry] = {}
+        self.loaded = False
+
+    @staticmethod
+    def get_hash(data: bytes) -> str:
+        r"""Get the hash of the content of a file.
+
+        :param data:
+        :type data: bytes
+        :rtype: str
+        """
+        return sha256(data).hexdigest()
+
+    def get(self, path: str) -> FileEntry | None:
+        r"""Get an entry whose file has the same mtime and size. Return
+        ``None`` if the file has been changed.
+
+        :param self:
+        :param path:
+        :type path: str
+        :rtype: FileEntry | None
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if (stat.st_mtime_ns, stat.st_size) != (entry.mtime_ns, entry.size):
+            return None
+        return entry
+
+    def set(self, path: str, entry: FileEntry) -> FileEntry:
+        r"""Set an entry. If its diagnostics are ``None``, reuse the old
+        ones.
+
+        :param self:
+        :param path:
+        :type path: str
+        :param entry:
+        :type entry: FileEntry
+        :rtype: FileEntry
+        """
+        if entry.diagnostics is None:
+            old = self.entries.get(path)
+            entry.diagnostics = old.diagnostics if old else []
+            entry.dependencies = old.dependencies if old else []
+        self.entries[path] = entry
+        return entry
+
+    def load(self) -> None:
+        r"""Load entries. A broken file is ignored.
+
+        :param self:
+        :rtype: None
+        """
+        self.loaded = True
+        if self.path == "":
+            return
+        converter = get_converter()
+        with suppress(OSError, ValueError, TypeError, KeyError):
+            with open(self.path) as f:
+                data = json.load(f)
+            if data["version"] != self.version:
+                return
+            self.entries = {
+                path: FileEntry(
+                    entry["mtime_ns"],
+                    entry["size"],
+                    entry["hash"],
+                    converter.structure(
+                        entry["diagnostics"], list[Diagnostic]
+                    ),
+                    entry["dependencies"],
+                )
+                for path, entry in data["files"].items()
+            }
+
+    def save(self) -> None:
+        r"""Save entries.
+
+        :param self:
+        :rtype: None
+        """
+        if self.path == "":
+            return
+        converter = get_converter()
+        data = {
+            "version": self.version,
+            "files": {
+                path: {
+                    "mtime_ns": entry.mtime_ns,
+                    "size": entry.size,
+                    "hash": entry.hash,
+                    "diagnostics": converter.unstructure(entry.diagnostics),
+                    "dependencies": entry.dependencies,
+                }
+                for path, entry in self.entries.items()
+            },
+        }
+        with suppress(OSError):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(data, f)
+
+
+class FileDependencies:
+    r"""Values computed from files and directories, and the documents which
+    depend on them. Values are only cached when it is enabled, because they
+    are only invalidated by watching files.
+    """
+
+    def __init__(self) -> None:
+        r"""Init.
+
+        :param self:
+        :rtype: None
+        """
+        self.enabled = False
+        self.values: dict[str, Any] = {}
+        # file -> paths of documents
+        self.dependents: dict[str, set[str]] = {}
+        # linters run in threads while files are invalidated
+        self.lock = Lock()
+
+    def get(self, file: str, path: str, factory: Callable[[], T]) -> T:
+        r"""Get the value of a file for a document.
+
+        :param self:
+        :param file:
+        :type file: str
+        :param path: the path of the document
+        :type path: str
+        :param factory: compute the value
+        :type factory: Callable[[], T]
+        :rtype: T
+        """
+        if not self.enabled:
+            return factory()
+        with self.lock:
+            self.dependents.setdefault(file, set()).add(path)
+            if file not in self.values:
+                self.values[file] = factory()
+            return self.values[file]
+
+    def get_files(self, path: str) -> list[str]:
+        r"""Get the files which a document depends on.
+
+        :param self:
+        :param path: the path of the document
+        :type path: str
+        :rtype: list[str]
+        """
+        with self.lock:
+            return sorted(
+                file
+                for file, paths in self.dependents.items()
+                if path in paths
+            )
+
+    @staticmethod
+    def contain(parent: str, path: str) -> bool:
+        r"""Judge if a path is the same as or under a directory.
+
+        :param parent:
+        :type parent: str
+        :param path:
+        :type path: str
+        :rtype: bool
+        """
+        return path == parent or path.startswith(
+            parent.rstrip(os.sep) + os.sep
+        )
+
+    def invalidate(self, paths: list[str]) -> set[str]:
+        r"""Invalidate the values of changed files, the directories containing
+        them and the files under them.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: set[str]
+        """
+        documents = set()
+        with self.lock:
+            for file in list(self.dependents):
+                if self.touch(file, paths):
+                    self.values.pop(file, None)
+                    documents |= self.dependents.pop(file)
+        return documents
+
+    @classmethod
+    def touch(cls, file: str, paths: list[str]) -> bool:
+        r"""Judge if a file is changed by changed files. A directory is
+        changed by the files under it, and a file is changed by the
+        directories containing it.
+
+        :param cls:
+        :param file:
+        :type file: str
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: bool
+        """
+        return any(
+            cls.contain(file, path) or cls.contain(path, file)
+            for path in paths
+        )
+
+
+class InvalidationBus:
+    r"""Notify subscribers that files have changed. Each subscriber returns
+    the paths of the documents depending on them.
+    """
+
+    def __init__(self) -> None:
+        r"""Init.
+
+        :param self:
+        :rtype: None
+        """
+        self.subscribers: list[Callable[[list[str]], set[str]]] = []
+
+    def subscribe(self, callback: Callable[[list[str]], set[str]]) -> None:
+        r"""Subscribe.
+
+        :param self:
+        :param callback:
+        :type callback: Callable[[list[str]], set[str]]
+        :rtype: None
+        """
+        self.subscribers += [callback]
+
+    def publish(self, paths: list[str]) -> set[str]:
+        r"""Publish changed files.
+
+        :param self:
+        :param paths:
+        :type paths: list[str]
+        :rtype: set[str]
+        """
+        documents = set()
+        for callback in self.subscribers:
+            documents |= callback(paths)
+        return documents
+
+
+class ProgramCache:
+    r"""LRU cache of compiled jq programs.
+
+    Compiling a program costs much more than running it. Variables are
+    passed to a program with its input, such as
+    ``. as [$__input, $name] | $__input | (CODE)``, so a program is compiled
+    once for all values of its variables. A program using ``$ARGS`` gets
+    ``$ARGS.named`` like ``jq --arg``. A program with ``import`` or
+    ``include`` cannot be wrapped, so its variables are compiled into it and
+    ``$ARGS`` is undefined.
+    """
+
+    identifier: re.Pattern = re.compile(r"[a-zA-Z_][a-zA-Z_0-9]*")
+    directive: re.Pattern = re.compile(r"\s*(import|include)\b")
+
+    def __init__(self, max_size: int = 1024) -> None:
+        r"""Init.
+
+        :param self:
+        :param max_size:
+        :type max_size: int
+        :rtype: None
+        """
+        self.max_size = max_size
+        self.programs: OrderedDict[Hashable, Any] = OrderedDict()
+        self.lock = Lock()
+
+    def compile(self, code: str, args: dict[str, Any] | None = None) -> Any:
+        r"""Get a compiled program. Compile it at first.
+
+        :param self:
+        :param code:
+        :type code: str
+        :param args: variables compiled into the program
+        :type args: dict[str, Any] | None
+        :rtype: Any
+        """
+        key = code, json.dumps(args, sort_keys=True) if args else ""
+        with self.lock:
+            program = self.programs.get(key)
+            if program is not None:
+                self.programs.move_to_end(key)
+                return program
+        with metrics.time("jq.compile"):
+            program = jq.compile(code, args=args)
+        with self.lock:
+            self.programs[key] = program
+            if len(self.programs) > self.max_size:
+                self.programs.popitem(last=False)
+        return program
+
+    def input_value(
+        self, code: str, value: Any, args: dict[str, Any] | None = None
+    ) -> Any:
+        r"""Run a program with an input. Call ``first()`` or ``all()`` of
+        the result.
+
+        :param self:
+        :param code:
+        :type code: str
+        :param value:
+        :type value: Any
+        :param args: the values of variables
+        :type args: dict[str, Any] | None
+        :rtype: Any
+        """
+        if self.directive.match(code):
+            return self.compile(code, args).input_value(value)
+        args = args or {}
+        # other names can only be got from $ARGS
+        names = sorted(
+            name for name in args if self.identifier.fullmatch(name)
+        )
+        variables = "".join(f", ${name}" for name in names)
+        values = [args[name] for name in names]
+        bindings = ""
+        if "$ARGS" in code:
+            variables = ", $__named" + variables
+            values = [args, *values]
+            bindings = "{named: $__named, positional: []} as $ARGS | "
+        if variables == "":
+            return self.compile(code).input_value(value)
+        program = self.compile(
+            f". as [$__input{variables}] | {bindings}$__input | ({code}\n)"
+        )
+        return program.input_value([value, *values])
+
+    def clear(self) -> None:
+        r"""Clear.
+
+        :param self:
+        :rtype: None
+        """
+        with self.lock:
+            self.programs.clear()
+
+
+class ValidatorCache:
+    r"""LRU cache of JSON schema validators.
+
+    A validator is looked up by the identity of its schema at first, which
+    is free for the schemas cached by :class:`FileDependencies`. A schema
+    which isn't the same object is looked up by the hash of its content.
+    A schema mustn't be changed in place.
+    """
+
+    def __init__(self, max_size: int = 16) -> None:
+        r"""Init.
+
+        :param self:
+        :param max_size:
+        :type max_size: int
+        :rtype: None
+        """
+        self.max_size = max_size
+        # id -> schema, validator. schema keeps its id unique
+        self.schemas: OrderedDict[int, tuple[Any, Validator]] = OrderedDict()
+        self.validators: OrderedDict[str, Validator] = OrderedDict()
+        self.lock = Lock()
+
+    @staticmethod
+    def get_hash(schema: Any) -> str:
+        r"""Get the hash of a schema.
+
+        :param schema:
+        :type schema: Any
+        :rtype: str
+        """
+        return sha256(
+            json.dumps(schema, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def get(self, schema: Any) -> Validator:
+        r"""Get the validator of a schema. Create it at first.
+
+        :param self:
+        :param schema:
+        :type schema: Any
+        :rtype: Validator
+        """
+        with self.lock:
+            cached, validator = self.schemas.get(id(schema), (None, None))
+            if cached is schema and validator is not None:
+                self.schemas.move_to_end(id(schema))
+                return validator
+        key = self.get_hash(schema)
+        with self.lock:
+            validator = self.validators.get(key)
+        if validator is None:
+            with metrics.time("jsonschema.validator"):
+                validator = validator_for(schema)(schema)
+        with self.lock:
+            self.validators[key] = validator
+            self.validators.move_to_end(key)
+            self.schemas[id(schema)] = schema, validator
+            self.schemas.move_to_end(id(schema))
+            for cache in (self.validators, self.schemas):
+                while len(cache) > self.max_size:
+                    cache.popitem(last=False)
+        return validator
+
+    def invalidate(self) -> None:
+        r"""Invalidate all validators.
+
+        :param self:
+        :rtype: None
+        """
+        with self.lock:
+            self.schemas.clear()
+            self.validators.clear()
+
+
+# shared by all linters and completers
+programs = ProgramCache()
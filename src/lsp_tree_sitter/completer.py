@@ -9,9 +9,8 @@ from collections.abc import Callable
 from contextlib import suppress
 from dataclasses import dataclass, field
 from glob import glob
-from typing import Any
+from typing import Any, ClassVar
 
-import jq
 from lsprotocol.types import (
     CompletionItem,
     CompletionItemKind,
@@ -21,15 +20,25 @@ from lsprotocol.types import (
     MarkupKind,
     Position,
 )
-from tree_sitter import Node, Point, Tree
+from tree_sitter import Node, Tree
 
+from .cache import FileDependencies, programs
+from .metrics import metrics
 from .node import NodeDict, NodeOps, NodeRange, PackageSearcher
+from .policy import Policy
 
 
 @dataclass
 class Completer:
     r"""Completer."""
 
+    # completers only use the node under the cursor, so ``sample`` is same
+    # as ``full``
+    policy: ClassVar[Policy] = Policy()
+    files: FileDependencies = field(
+        default_factory=FileDependencies, init=False, repr=False, compare=False
+    )
+
     def complete(
         self, tree: Tree, position: Position, path: str
     ) -> CompletionList:
@@ -44,7 +53,8 @@ class Completer:
         :type path: str
         :rtype: CompletionList
         """
-        point = Point(position.line, position.character - 1)
+        # constructing Point leaks a reference of its type in tree-sitter 0.26
+        point = position.line, position.character - 1
         node = tree.root_node.descendant_for_point_range(point, point)
         args = self.args_callback(node, point)
         args["complete"] = True
@@ -74,7 +84,7 @@ class Completer:
         :type path: str
         :rtype: Hover | None
         """
-        point = Point(position.line, position.character)
+        point = position.line, position.character
         node = tree.root_node.descendant_for_point_range(point, point)
         args = self.args_callback(node, point)
         results = self(args, path, node)
@@ -102,7 +112,7 @@ class Completer:
         :param kwargs:
         :rtype: MarkupContent | None
         """
-        args = self.args_callback(None, Point(-1, -1))
+        args = self.args_callback(None, (-1, -1))
         args["nodes"][0]["type"] = type
         args["nodes"][0]["text"] = text
         args.update(kwargs)
@@ -130,7 +140,7 @@ class Completer:
         :param kwargs:
         :rtype: list[CompletionItem]
         """
-        args = self.args_callback(None, Point(-1, -1))
+        args = self.args_callback(None, (-1, -1))
         args["nodes"][0]["type"] = type
         args["nodes"][0]["text"] = text
         args["complete"] = True
@@ -149,14 +159,39 @@ class Completer:
             items += [item]
         return items
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        r"""Record the latencies of the methods of subclasses.
+
+        :param cls:
+        :param kwargs:
+        :rtype: None
+        """
+        super().__init_subclass__(**kwargs)
+        for method in ("complete", "hover"):
+            if method in vars(cls):
+                function = metrics.timed_method(method)(vars(cls)[method])
+                setattr(cls, method, function)
+
+    def invalidate(self, paths: list[str]) -> set[str]:
+        r"""Invalidate the cached values of changed files.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: set[str]
+        """
+        return self.files.invalidate(paths)
+
     @staticmethod
-    def args_callback(node: Node | None, point: Point) -> dict[str, Any]:
+    def args_callback(
+        node: Node | None, point: tuple[int, int]
+    ) -> dict[str, Any]:
         r"""Args callback.
 
         :param node:
         :type node: Node | None
         :param point:
-        :type point: Point
+        :type point: tuple[int, int]
         :rtype: dict[str, Any]
         """
         return {
@@ -220,8 +255,15 @@ class PathCompleter(Completer):
             return []
         root_dir = os.path.dirname(path)
         results = []
+        # expr -> filenames
+        listings: dict[str, list[str]] = self.files.get(root_dir, path, dict)
         for expr, filetype in self.filetypes.items():
-            for filename in glob(expr, root_dir=root_dir, recursive=True):
+            filenames = listings.get(expr)
+            if filenames is None:
+                filenames = listings[expr] = glob(
+                    expr, root_dir=root_dir, recursive=True
+                )
+            for filename in filenames:
                 if not (
                     filename.startswith(args["nodes"][0]["text"])
                     if args["complete"]
@@ -352,13 +394,22 @@ class SchemaCompleter(Completer):
         with open(code_file) as f:
             code = f.read()
         if isinstance(schema_getter, str):
-            with open(schema_getter) as f:
-                schema = json.load(f)
+            schema_file = os.path.abspath(schema_getter)
+
+            def load() -> Any:
+                with open(schema_file) as f:
+                    return json.load(f)
+
+            schema = load()
 
-            def schema_getter(_: str):
-                return schema
+            # reload the schema after it is changed
+            def schema_getter(path: str):
+                if not completer.files.enabled:
+                    return schema
+                return completer.files.get(schema_file, path, load)
 
-        return cls(code, schema_getter, *args, **kwargs)
+        completer = cls(code, schema_getter, *args, **kwargs)
+        return completer
 
     @staticmethod
     def query(
@@ -374,8 +425,7 @@ class SchemaCompleter(Completer):
         :type schema: dict
         :rtype: list[dict[str, Any]]
         """
-        program = jq.compile(code, args=args)
-        output = program.input_value(schema)
+        output = programs.input_value(code, schema, args)
         results = []
         if args["complete"]:
             results = output.all()
@@ -410,13 +460,15 @@ class ValueCompleter(SchemaCompleter):
 
     selectors: tuple[str, ...] = ("-",)
 
-    def args_callback(self, node: Node | None, point: Point) -> dict[str, Any]:
+    def args_callback(
+        self, node: Node | None, point: tuple[int, int]
+    ) -> dict[str, Any]:
         r"""Args callback.
 
         :param node:
         :type node: Node | None
         :param point:
-        :type point: Point
+        :type point: tuple[int, int]
         :rtype: dict[str, Any]
         """
         args = super().args_callback(node, point)
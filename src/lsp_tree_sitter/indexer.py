@@ -0,0 +1,280 @@
+r"""Indexer
+===========
+
+Lint the files of workspaces in background.
+"""
+
+import asyncio
+import os
+from collections.abc import Callable
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from concurrent.futures.process import BrokenProcessPool
+from fnmatch import fnmatch
+from multiprocessing import get_context
+from typing import TYPE_CHECKING
+
+from .cache import FileCache, FileDependencies, FileEntry
+
+if TYPE_CHECKING:
+    from .server import TreeSitterLanguageServer
+
+# the server of a worker process
+_server: "TreeSitterLanguageServer | None" = None
+
+
+def init_worker(cls: type["TreeSitterLanguageServer"], version: str) -> None:
+    r"""Create the server of a worker process. Its caches depending on files
+    are enabled to record the dependencies of files, because the worker is
+    replaced after they change.
+
+    :param cls:
+    :type cls: type[TreeSitterLanguageServer]
+    :param version:
+    :type version: str
+    :rtype: None
+    """
+    global _server
+    _server = cls(version=version)  # type: ignore
+    for item in (*_server.linters, *_server.completers):
+        item.files.enabled = True
+
+
+def index_file(
+    path: str,
+    digest: str = "",
+    server: "TreeSitterLanguageServer | None" = None,
+) -> FileEntry:
+    r"""Lint a file in a worker.
+
+    :param path:
+    :type path: str
+    :param digest: don't lint the file if its hash is same
+    :type digest: str
+    :param server: the server of the worker process if it is ``None``
+    :type server: TreeSitterLanguageServer | None
+    :rtype: FileEntry
+    """
+    server = server or _server
+    if server is None:
+        raise RuntimeError("the worker has no server")
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        source = f.read()
+    entry = FileEntry(
+        stat.st_mtime_ns, stat.st_size, FileCache.get_hash(source)
+    )
+    if entry.hash != digest:
+        tree, degraded = server.parse_bytes(source)
+        with server.bind(path, keep=False):
+            entry.diagnostics = (
+                server.get_diagnostics(
+                    tree, path, degraded=degraded, limited=True
+                )
+                or []
+            )
+        entry.dependencies = sorted({
+            file
+            for item in server.linters
+            for file in item.files.get_files(path)
+        })
+    return entry
+
+
+class WorkspaceIndexer:
+    r"""Workspace indexer.
+
+    Files are parsed and linted across a process pool. Each worker is spawned,
+    so it doesn't inherit the threads and the held locks of the server, and
+    creates its server by ``type(server)(version=server.version)`` like
+    ``__main__.py``. If the server cannot be created so, a thread pool
+    sharing the linters of the server is used.
+    """
+
+    def __init__(
+        self,
+        server: "TreeSitterLanguageServer",
+        cache: FileCache,
+        max_workers: int | None = None,
+    ) -> None:
+        r"""Init.
+
+        :param self:
+        :param server:
+        :type server: TreeSitterLanguageServer
+        :param cache:
+        :type cache: FileCache
+        :param max_workers:
+        :type max_workers: int | None
+        :rtype: None
+        """
+        self.server = server
+        self.cache = cache
+        self.max_workers = max_workers
+        self.executor: Executor | None = None
+        # whether workers are processes
+        self.processes = True
+
+    def get_executor(self) -> Executor:
+        r"""Get the executor. Create it at first.
+
+        :param self:
+        :rtype: Executor
+        """
+        if self.executor is None:
+            if self.processes:
+                self.executor = ProcessPoolExecutor(
+                    self.max_workers,
+                    get_context("spawn"),
+                    init_worker,
+                    (type(self.server), self.server.version),
+                )
+            else:
+                self.executor = ThreadPoolExecutor(self.max_workers)
+        return self.executor
+
+    async def index_file(self, path: str, digest: str = "") -> FileEntry:
+        r"""Lint a file in a worker. If worker processes cannot create the
+        server, fall back to threads.
+
+        :param self:
+        :param path:
+        :type path: str
+        :param digest: don't lint the file if its hash is same
+        :type digest: str
+        :rtype: FileEntry
+        """
+        loop = asyncio.get_running_loop()
+        if self.processes:
+            try:
+                return await loop.run_in_executor(
+                    self.get_executor(), index_file, path, digest
+                )
+            except BrokenProcessPool:
+                if self.processes:
+                    self.processes = False
+                    self.shutdown()
+        return await loop.run_in_executor(
+            self.get_executor(), index_file, path, digest, self.server
+        )
+
+    def invalidate(self, paths: list[str], documents: set[str]) -> set[str]:
+        r"""Drop the entries of changed files and the files depending on
+        them. Return the dropped files. Worker processes are replaced if the
+        values cached by them are invalidated.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :param documents: the paths of files depending on changed files,
+            which are linted by the server
+        :type documents: set[str]
+        :rtype: set[str]
+        """
+        files = set()
+        for file, entry in self.cache.entries.items():
+            if file in documents or file in paths:
+                files.add(file)
+            elif any(
+                FileDependencies.touch(dependency, paths)
+                for dependency in entry.dependencies
+            ):
+                files.add(file)
+                if isinstance(self.executor, ProcessPoolExecutor):
+                    self.executor.shutdown(wait=False)
+                    self.executor = None
+        for file in files:
+            del self.cache.entries[file]
+        if files:
+            self.cache.save()
+        return files
+
+    def shutdown(self) -> None:
+        r"""Shutdown the executor.
+
+        :param self:
+        :rtype: None
+        """
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def get_files(self, *roots: str) -> list[str]:
+        r"""Get the files matching ``workspace_patterns`` of the server.
+        Hidden directories are skipped.
+
+        :param self:
+        :param roots:
+        :type roots: str
+        :rtype: list[str]
+        """
+        files = []
+        for root in roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [
+                    dirname
+                    for dirname in dirnames
+                    if not dirname.startswith(".")
+                ]
+                files += [
+                    os.path.join(dirpath, filename)
+                    for filename in filenames
+                    if any(
+                        fnmatch(filename, pattern)
+                        for pattern in self.server.workspace_patterns
+                    )
+                ]
+        return sorted(files)
+
+    async def index(
+        self,
+        files: list[str],
+        report: Callable[[int, int], None] | None = None,
+    ) -> dict[str, FileEntry]:
+        r"""Lint files. Unchanged files are read from the cache. Unreadable
+        files are skipped.
+
+        :param self:
+        :param files:
+        :type files: list[str]
+        :param report: get the number of indexed files and all files
+        :type report: Callable[[int, int], None] | None
+        :rtype: dict[str, FileEntry]
+        """
+        if not self.cache.loaded:
+            self.cache.load()
+        entries: dict[str, FileEntry] = {}
+        changed = []
+        for file in files:
+            entry = self.cache.get(file)
+            if entry is None:
+                changed += [file]
+            else:
+                entries[file] = entry
+
+        async def run(file: str) -> tuple[str, FileEntry | None]:
+            old = self.cache.entries.get(file)
+            try:
+                entry = await self.index_file(file, old.hash if old else "")
+            except OSError:
+                return file, None
+            return file, entry
+
+        done = len(entries)
+        if report is not None:
+            report(done, len(files))
+        for coroutine in asyncio.as_completed([run(file) for file in changed]):
+            file, entry = await coroutine
+            if entry is None:
+                self.cache.entries.pop(file, None)
+            else:
+                entries[file] = self.cache.set(file, entry)
+            done += 1
+            if report is not None:
+                report(done, len(files))
+        if changed:
+            self.cache.save()
+        return entries
@@ -7,16 +7,17 @@ Support lint/link/diagnose.
 import json
 import os
 import re
-from collections.abc import Callable
-from contextlib import suppress
+from bisect import bisect_right
+from collections.abc import Callable, Generator
+from contextlib import contextmanager, suppress
 from dataclasses import dataclass, field
+from functools import partial
 from shlex import split
+from threading import Lock, local
 from types import ModuleType
-from typing import Any
+from typing import Any, ClassVar
 
-import jq
 from jsonschema.protocols import Validator
-from jsonschema.validators import validator_for
 from lsprotocol.types import (
     Diagnostic,
     DiagnosticSeverity,
@@ -24,15 +25,51 @@ from lsprotocol.types import (
     DocumentSymbol,
     InlayHint,
 )
-from tree_sitter import Language, Node, Query, QueryCursor, Tree
+from tree_sitter import (
+    Language,
+    Node,
+    Query,
+    QueryCursor,
+    QueryError,
+    Tree,
+)
 
+from .cache import FileDependencies, ValidatorCache, programs
+from .metrics import metrics
 from .node import NodeRange, NodeText, NodeTuples, PackageSearcher
+from .policy import Policy
 
 
 @dataclass
 class LinterBase:
     r"""Linter base."""
 
+    # whether an item only depends on its node, so the linter can be
+    # restricted to byte ranges
+    incremental: ClassVar[bool] = False
+    # whether the linter only uses :meth:`Linter.get_captures`, so its query
+    # can be combined with others by :class:`CaptureDispatcher`
+    dispatch: ClassVar[bool] = False
+    # whether the linter is skipped for degraded documents
+    expensive: ClassVar[bool] = False
+    policy: ClassVar[Policy] = Policy()
+    files: FileDependencies = field(
+        default_factory=FileDependencies, init=False, repr=False, compare=False
+    )
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        r"""Record the latencies of the methods of subclasses.
+
+        :param cls:
+        :param kwargs:
+        :rtype: None
+        """
+        super().__init_subclass__(**kwargs)
+        for method in ("diagnose", "link", "hint", "symbol"):
+            if method in vars(cls):
+                function = metrics.timed_method(method)(vars(cls)[method])
+                setattr(cls, method, function)
+
     def diagnose(self, tree: Tree, path: str) -> list[Diagnostic]:
         r"""Get diagnostics.
 
@@ -44,7 +81,12 @@ class LinterBase:
         """
         return []
 
-    def link(self, tree: Tree, path: str) -> list[DocumentLink]:
+    def link(
+        self,
+        tree: Tree,
+        path: str,
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> list[DocumentLink]:
         r"""Get links.
 
         :param self:
@@ -52,11 +94,18 @@ class LinterBase:
         :type tree: Tree
         :param path:
         :type path: str
+        :param ranges: byte ranges for :attr:`incremental` linters
+        :type ranges: list[tuple[int, int]] | None
         :rtype: list[DocumentLink]
         """
         return []
 
-    def hint(self, tree: Tree, path: str) -> list[InlayHint]:
+    def hint(
+        self,
+        tree: Tree,
+        path: str,
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> list[InlayHint]:
         r"""Get inlay hints.
 
         :param self:
@@ -64,6 +113,8 @@ class LinterBase:
         :type tree: Tree
         :param path:
         :type path: str
+        :param ranges: byte ranges for :attr:`incremental` linters
+        :type ranges: list[tuple[int, int]] | None
         :rtype: list[InlayHint]
         """
         return []
@@ -80,6 +131,25 @@ class LinterBase:
         """
         return []
 
+    def invalidate(self, paths: list[str]) -> set[str]:
+        r"""Invalidate the cached values of changed files.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: set[str]
+        """
+        return self.files.invalidate(paths)
+
+    def warm(self, path: str) -> None:
+        r"""Build expensive values before the first request.
+
+        :param self:
+        :param path: the path of the workspace
+        :type path: str
+        :rtype: None
+        """
+
 
 @dataclass
 class Linter(LinterBase):
@@ -92,14 +162,47 @@ class Linter(LinterBase):
 
         :param self:
         """
-        self.cursor = QueryCursor(self.query)
+        self.local = local()
+        # the text of query for :class:`CaptureDispatcher`
+        self.text = ""
+        self.dispatcher: CaptureDispatcher | None = None
+
+    @property
+    def cursor(self) -> QueryCursor:
+        r"""Query cursor. A query cursor cannot be shared between threads,
+        so each thread has its own one.
+
+        :param self:
+        :rtype: QueryCursor
+        """
+        cursor = getattr(self.local, "cursor", None)
+        if cursor is None:
+            cursor = self.local.cursor = QueryCursor(self.query)
+        return cursor
 
     @staticmethod
+    def queries_to_text(queries: ModuleType, name: str) -> str:
+        r"""Queries to the text of a query.
+
+        :param queries:
+        :type queries: ModuleType
+        :param name:
+        :type name: str
+        :rtype: str
+        """
+        paths: list[str] = queries.__path__._path  # ty:ignore[unresolved-attribute]
+        query_file = os.path.join(paths[0], name)
+        with open(query_file) as f:
+            text = f.read()
+        return text
+
+    @classmethod
     def queries_to_query(
-        language: Language, queries: ModuleType, name: str
+        cls, language: Language, queries: ModuleType, name: str
     ) -> Query:
         r"""Queries to query.
 
+        :param cls:
         :param language:
         :type language: Language
         :param queries:
@@ -108,13 +211,38 @@ class Linter(LinterBase):
         :type name: str
         :rtype: Query
         """
-        paths: list[str] = queries.__path__._path  # ty:ignore[unresolved-attribute]
-        query_file = os.path.join(paths[0], name)
-        with open(query_file) as f:
-            text = f.read()
-        query = Query(language, text)
+        query = Query(language, cls.queries_to_text(queries, name))
         return query
 
+    def get_captures(
+        self, tree: Tree, ranges: list[tuple[int, int]] | None = None
+    ) -> dict[str, list[Node]]:
+        r"""Get captures.
+
+        :param self:
+        :param tree:
+        :type tree: Tree
+        :param ranges: only get the captures intersecting these byte ranges
+        :type ranges: list[tuple[int, int]] | None
+        :rtype: dict[str, list[Node]]
+        """
+        if ranges is None:
+            if self.dispatcher is not None:
+                captures = self.dispatcher.get_captures(self, tree)
+                if captures is not None:
+                    return captures
+            return self.cursor.captures(tree.root_node)
+        cursor = QueryCursor(self.query)
+        captures: dict[str, dict[int, Node]] = {}
+        for start, end in ranges:
+            cursor.set_byte_range(start, end)
+            for label, nodes in cursor.captures(tree.root_node).items():
+                for node in nodes:
+                    captures.setdefault(label, {})[node.id] = node
+        return {
+            label: list(nodes.values()) for label, nodes in captures.items()
+        }
+
     def __call__(
         self,
         tree: Tree,
@@ -134,7 +262,12 @@ class Linter(LinterBase):
         """
         raise NotImplementedError
 
-    def diagnose(self, tree: Tree, path: str) -> list[Diagnostic]:
+    def diagnose(
+        self,
+        tree: Tree,
+        path: str,
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> list[Diagnostic]:
         r"""Get diagnostics.
 
         :param self:
@@ -142,11 +275,20 @@ class Linter(LinterBase):
         :type tree: Tree
         :param path:
         :type path: str
+        :param ranges: byte ranges for :attr:`incremental` linters
+        :type ranges: list[tuple[int, int]] | None
         :rtype: list[Diagnostic]
         """
-        return self(tree, path, Diagnostic)
+        if ranges is None:
+            return self(tree, path, Diagnostic)
+        return self(tree, path, Diagnostic, ranges)
 
-    def link(self, tree: Tree, path: str) -> list[DocumentLink]:
+    def link(
+        self,
+        tree: Tree,
+        path: str,
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> list[DocumentLink]:
         r"""Get links.
 
         :param self:
@@ -154,11 +296,20 @@ class Linter(LinterBase):
         :type tree: Tree
         :param path:
         :type path: str
+        :param ranges: byte ranges for :attr:`incremental` linters
+        :type ranges: list[tuple[int, int]] | None
         :rtype: list[DocumentLink]
         """
-        return self(tree, path, DocumentLink)
+        if ranges is None:
+            return self(tree, path, DocumentLink)
+        return self(tree, path, DocumentLink, ranges)
 
-    def hint(self, tree: Tree, path: str) -> list[InlayHint]:
+    def hint(
+        self,
+        tree: Tree,
+        path: str,
+        ranges: list[tuple[int, int]] | None = None,
+    ) -> list[InlayHint]:
         r"""Get inlay hints.
 
         :param self:
@@ -166,9 +317,13 @@ class Linter(LinterBase):
         :type tree: Tree
         :param path:
         :type path: str
+        :param ranges: byte ranges for :attr:`incremental` linters
+        :type ranges: list[tuple[int, int]] | None
         :rtype: list[InlayHint]
         """
-        return self(tree, path, InlayHint)
+        if ranges is None:
+            return self(tree, path, InlayHint)
+        return self(tree, path, InlayHint, ranges)
 
     def symbol(self, tree: Tree, path: str) -> list[DocumentSymbol]:
         r"""Get symbols.
@@ -183,10 +338,166 @@ class Linter(LinterBase):
         return self(tree, path, DocumentSymbol)
 
 
+class CaptureDispatcher:
+    r"""Run the combined query of linters once per version of a document
+    and route the captures to each linter by the patterns of its query.
+    """
+
+    def __init__(self, language: Language, linters: list[Linter]) -> None:
+        r"""Init.
+
+        :param self:
+        :param language:
+        :type language: Language
+        :param linters: the texts of their queries must be known
+        :type linters: list[Linter]
+        :rtype: None
+        """
+        self.indices = {id(linter): i for i, linter in enumerate(linters)}
+        # the first pattern index of each linter
+        self.starts: list[int] = []
+        start = 0
+        for linter in linters:
+            self.starts += [start]
+            start += linter.query.pattern_count
+        self.query = Query(
+            language, "\n".join(linter.text for linter in linters)
+        )
+        self.local = local()
+        self.lock = Lock()
+        # the version, the tree and the routed captures of each document
+        self.captures: dict[
+            str, tuple[int | None, Tree, list[dict[str, list[Node]]]]
+        ] = {}
+
+    @classmethod
+    def from_linters(
+        cls, language: Language | None, linters: tuple[LinterBase, ...]
+    ) -> "CaptureDispatcher | None":
+        r"""Create a dispatcher for the linters which can be dispatched and
+        attach it to them. Return ``None`` if it is unnecessary.
+
+        :param cls:
+        :param language:
+        :type language: Language | None
+        :param linters:
+        :type linters: tuple[LinterBase, ...]
+        :rtype: CaptureDispatcher | None
+        """
+        dispatched = [
+            linter
+            for linter in linters
+            if isinstance(linter, Linter) and linter.dispatch and linter.text
+        ]
+        if language is None or len(dispatched) < 2:
+            return None
+        try:
+            dispatcher = cls(language, dispatched)
+        except QueryError:
+            # such as the same capture name with different predicates
+            return None
+        for linter in dispatched:
+            linter.dispatcher = dispatcher
+        return dispatcher
+
+    @contextmanager
+    def bind(
+        self, uri: str, version: int | None = None, keep: bool = True
+    ) -> Generator[None, None, None]:
+        r"""Cache the captures of the trees linted by the current thread in
+        the block by the URI and the version of their document.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param version:
+        :type version: int | None
+        :param keep: keep the captures after the block
+        :type keep: bool
+        :rtype: Generator[None, None, None]
+        """
+        key = getattr(self.local, "key", None)
+        self.local.key = uri, version
+        try:
+            yield
+        finally:
+            self.local.key = key
+            if not keep:
+                self.pop(uri)
+
+    def pop(self, uri: str) -> None:
+        r"""Forget the captures of a document, such as when its tree is
+        evicted or edited, or it is closed.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: None
+        """
+        with self.lock:
+            self.captures.pop(uri, None)
+
+    def get_captures(
+        self, linter: Linter, tree: Tree
+    ) -> dict[str, list[Node]] | None:
+        r"""Get the captures of a linter. The combined query only runs once
+        for a version of the document bound by :meth:`bind`. Return ``None``
+        if no document is bound. A snapshot of the tree has its own
+        captures, because editing a tree breaks the text of its nodes.
+
+        :param self:
+        :param linter:
+        :type linter: Linter
+        :param tree:
+        :type tree: Tree
+        :rtype: dict[str, list[Node]] | None
+        """
+        key = getattr(self.local, "key", None)
+        if key is None:
+            return None
+        uri, version = key
+        with self.lock:
+            entry = self.captures.get(uri)
+        if entry is None or entry[0] != version or entry[1] is not tree:
+            entry = version, tree, self.dispatch(tree)
+            with self.lock:
+                self.captures[uri] = entry
+        return entry[2][self.indices[id(linter)]]
+
+    def dispatch(self, tree: Tree) -> list[dict[str, list[Node]]]:
+        r"""Run the combined query and route the captures.
+
+        :param self:
+        :param tree:
+        :type tree: Tree
+        :rtype: list[dict[str, list[Node]]]
+        """
+        cursor = getattr(self.local, "cursor", None)
+        if cursor is None:
+            cursor = self.local.cursor = QueryCursor(self.query)
+        results: list[dict[str, dict[int, Node]]] = [{} for _ in self.starts]
+        for pattern, match in cursor.matches(tree.root_node):
+            captures = results[bisect_right(self.starts, pattern) - 1]
+            for label, nodes in match.items():
+                for node in nodes:
+                    captures.setdefault(label, {})[node.id] = node
+        # sort nodes by their positions
+        return [
+            {
+                label: sorted(nodes.values(), key=lambda x: x.start_byte)
+                for label, nodes in captures.items()
+            }
+            for captures in results
+        ]
+
+
 @dataclass
 class PathLinter(Linter):
     r"""Diagnose incorrect path and link correct path"""
 
+    incremental: ClassVar[bool] = True
+    dispatch: ClassVar[bool] = True
+    policy: ClassVar[Policy] = Policy(64 * 1024 * 1024, action="sample")
     label: str = "string.special.path"
     expanduser: bool = True
     expandvars: bool = True
@@ -206,14 +517,17 @@ class PathLinter(Linter):
         :param kwargs:
         :rtype: PathLinter
         """
-        query = cls.queries_to_query(language, queries, "highlights.scm")
-        return cls(query, *args, **kwargs)
+        text = cls.queries_to_text(queries, "highlights.scm")
+        linter = cls(Query(language, text), *args, **kwargs)
+        linter.text = text
+        return linter
 
     def __call__(
         self,
         tree: Tree,
         path: str,
         cls: type,
+        ranges: list[tuple[int, int]] | None = None,
     ) -> list[Any]:
         r"""diagnose, link, hint, symbol call it.
 
@@ -224,9 +538,11 @@ class PathLinter(Linter):
         :type path: str
         :param cls:
         :type cls: type
+        :param ranges: only lint the nodes intersecting these byte ranges
+        :type ranges: list[tuple[int, int]] | None
         :rtype: list[Any]
         """
-        captures = self.cursor.captures(tree.root_node)
+        captures = self.get_captures(tree, ranges)
         items = []
         dirname = os.path.dirname(path)
         for label, nodes in captures.items():
@@ -239,7 +555,9 @@ class PathLinter(Linter):
                 if self.expandvars:
                     text = os.path.expandvars(text)
                 filepath = os.path.join(dirname, text)
-                exist = os.path.exists(filepath)
+                exist = self.files.get(
+                    filepath, path, partial(os.path.exists, filepath)
+                )
                 range = NodeRange.from_node(node)
                 if cls == Diagnostic:
                     if exist:
@@ -263,7 +581,16 @@ class PathLinter(Linter):
 class PackageLinter(Linter):
     r"""Package linter."""
 
+    incremental: ClassVar[bool] = True
+    dispatch: ClassVar[bool] = True
+    expensive: ClassVar[bool] = True
+    # looking up packages is slow
+    policy: ClassVar[Policy] = Policy(4 * 1024 * 1024, 100000, action="sample")
     searcher_getter: Callable[[str], PackageSearcher | None]
+    # paths of documents -> their searchers
+    searchers: dict[str, PackageSearcher] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
 
     @classmethod
     def from_queries(
@@ -280,14 +607,17 @@ class PackageLinter(Linter):
         :param kwargs:
         :rtype: PackageLinter
         """
-        query = cls.queries_to_query(language, queries, "packages.scm")
-        return cls(query, *args, **kwargs)
+        text = cls.queries_to_text(queries, "packages.scm")
+        linter = cls(Query(language, text), *args, **kwargs)
+        linter.text = text
+        return linter
 
     def __call__(
         self,
         tree: Tree,
         path: str,
         cls: type,
+        ranges: list[tuple[int, int]] | None = None,
     ) -> list[Any]:
         r"""diagnose, link, hint, symbol call it.
 
@@ -298,12 +628,16 @@ class PackageLinter(Linter):
         :type path: str
         :param cls:
         :type cls: type
+        :param ranges: only lint the nodes intersecting these byte ranges
+        :type ranges: list[tuple[int, int]] | None
         :rtype: list[Any]
         """
         searcher = self.searcher_getter(path)
         if searcher is None:
             return []
-        captures = self.cursor.captures(tree.root_node)
+        if self.files.enabled:
+            self.searchers[path] = searcher
+        captures = self.get_captures(tree, ranges)
         items = []
         for label, nodes in captures.items():
             if label != searcher.label:
@@ -340,6 +674,21 @@ class PackageLinter(Linter):
                 items += [item]
         return items
 
+    def invalidate(self, paths: list[str]) -> set[str]:
+        r"""Invalidate the cached values of changed files and the lookups of
+        searchers.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: set[str]
+        """
+        return super().invalidate(paths) | {
+            path
+            for path, searcher in self.searchers.items()
+            if searcher.invalidate(paths)
+        }
+
 
 class Args(dict[str, str]):
     r"""Environment for jq"""
@@ -372,40 +721,155 @@ class Args(dict[str, str]):
 
         return obj_type
 
-    def parse_key(
+    def parse_path(
         self,
         key: str,
-        lens: dict[str, int],
-        instance,
-    ) -> tuple[str, Callable[[str], Any]]:
-        r"""Parse key.
+        lens: dict[tuple[str | int, ...], int],
+        get_len: Callable[[list[str | int]], int],
+    ) -> tuple[list[str | int], Callable[[str], Any]]:
+        r"""Parse a key to a path of keys and indices.
+
+        ``-`` is the length of the array, which is invariable in a match.
+        ``--`` is the length of the array, which is updated. ``-name`` is
+        the argument ``name``. ``--type`` converts the value to ``type``.
 
         :param self:
         :param key:
         :type key: str
-        :param lens:
-        :type lens: dict[str, int]
-        :param instance:
-        :rtype: tuple[str, Callable[[str], Any]]
+        :param lens: the lengths of arrays in a match
+        :type lens: dict[tuple[str | int, ...], int]
+        :param get_len: get the length of the array of a path
+        :type get_len: Callable[[list[str | int]], int]
+        :rtype: tuple[list[str | int], Callable[[str], Any]]
         """
-        code = "."
-        scopes = key.split(".")
+        path: list[str | int] = []
         obj_type = str
-        for scope in scopes:
+        for scope in key.split("."):
             if scope == "-":
-                if code not in lens:
-                    lens[code] = self.get_len_by_code(instance, code)
-                scope = lens[code]
+                if tuple(path) not in lens:
+                    lens[tuple(path)] = get_len(path)
+                path += [lens[tuple(path)]]
             elif scope == "--":
-                lens[code] = self.get_len_by_code(instance, code)
-                scope = lens[code]
+                lens[tuple(path)] = get_len(path)
+                path += [lens[tuple(path)]]
             elif scope.startswith("--"):
                 obj_type = self.get_obj_type(scope[2:])
                 break
             elif scope.startswith("-"):
-                scope = self[scope[1:]]
-            code += f"[{json.dumps(scope)}]"
-        return code, obj_type
+                path += [self[scope[1:]]]
+            else:
+                path += [scope]
+        return path, obj_type
+
+    def parse_key(
+        self,
+        key: str,
+        lens: dict[tuple[str | int, ...], int],
+        instance,
+    ) -> tuple[str, Callable[[str], Any]]:
+        r"""Parse key to jq code.
+
+        :param self:
+        :param key:
+        :type key: str
+        :param lens:
+        :type lens: dict[tuple[str | int, ...], int]
+        :param instance:
+        :rtype: tuple[str, Callable[[str], Any]]
+        """
+        path, obj_type = self.parse_path(
+            key,
+            lens,
+            lambda path: self.get_len_by_code(
+                instance, self.path_to_code(path)
+            ),
+        )
+        return self.path_to_code(path), obj_type
+
+    @staticmethod
+    def path_to_code(path: list[str | int]) -> str:
+        r"""Convert a path to jq code.
+
+        :param path:
+        :type path: list[str | int]
+        :rtype: str
+        """
+        return "." + "".join(f"[{json.dumps(scope)}]" for scope in path)
+
+    @staticmethod
+    def to_json(obj) -> Any:
+        r"""Convert an object to the JSON data which jq outputs, such as
+        tuples to lists.
+
+        :param obj:
+        :rtype: Any
+        """
+        if isinstance(obj, (list, tuple)):
+            return [Args.to_json(child) for child in obj]
+        if isinstance(obj, dict):
+            return {str(k): Args.to_json(v) for k, v in obj.items()}
+        if isinstance(obj, str):
+            return str(obj)
+        return obj
+
+    @staticmethod
+    def get_by_path(instance, path: list[str | int]):
+        r"""Get by path like jq. A missing key or index gets ``None``.
+
+        :param instance:
+        :param path:
+        :type path: list[str | int]
+        """
+        for scope in path:
+            if instance is None:
+                return None
+            if isinstance(scope, int) and isinstance(instance, list):
+                instance = instance[scope] if scope < len(instance) else None
+            elif isinstance(scope, str) and isinstance(instance, dict):
+                instance = instance.get(scope)
+            else:
+                raise ValueError(
+                    f"Cannot index {type(instance).__name__} with {scope!r}"
+                )
+        return instance
+
+    @staticmethod
+    def get_len_by_path(instance, path: list[str | int]) -> int:
+        r"""Get len by path.
+
+        :param instance:
+        :param path:
+        :type path: list[str | int]
+        :rtype: int
+        """
+        result = Args.get_by_path(instance, path)
+        return len(result) if isinstance(result, list) else 0
+
+    @staticmethod
+    def set_by_path(instance, path: list[str | int], obj):
+        r"""Set by path in place like jq. Missing objects and arrays are
+        created, and arrays are padded with ``None``. Return the instance.
+
+        :param instance:
+        :param path:
+        :type path: list[str | int]
+        :param obj:
+        """
+        if len(path) == 0:
+            return Args.to_json(obj)
+        scope, *path = path
+        if instance is None:
+            instance = [] if isinstance(scope, int) else {}
+        if isinstance(scope, int) and isinstance(instance, list):
+            instance += [None] * (scope + 1 - len(instance))
+            instance[scope] = Args.set_by_path(instance[scope], path, obj)
+        elif isinstance(scope, str) and isinstance(instance, dict):
+            instance[scope] = Args.set_by_path(instance.get(scope), path, obj)
+        else:
+            raise ValueError(
+                f"Cannot index {type(instance).__name__} with {scope!r}"
+            )
+        return instance
 
     def get_by_code(self, instance, code: str):
         r"""Get by code.
@@ -415,8 +879,7 @@ class Args(dict[str, str]):
         :param code:
         :type code: str
         """
-        program = jq.compile(code, args=self)
-        result = program.input_value(instance).first()
+        result = programs.input_value(code, instance, self).first()
         return result
 
     def get_len_by_code(self, instance, code: str) -> int:
@@ -452,8 +915,9 @@ class Args(dict[str, str]):
         :type code: str
         :param obj:
         """
-        program = jq.compile(code + f" = {json.dumps(obj)}", args=self)
-        result = program.input_value(result).first()
+        result = programs.input_value(
+            code + " = $__value", result, {**self, "__value": obj}
+        ).first()
         return result
 
 
@@ -461,10 +925,18 @@ class Args(dict[str, str]):
 class SchemaLinter(Linter):
     r"""Schema linter."""
 
+    expensive: ClassVar[bool] = True
+    # instantiation and validation need the whole document
+    policy: ClassVar[Policy] = Policy(4 * 1024 * 1024, 100000)
     validator_getter: Callable[[str], Validator | None]
     regex: re.Pattern = field(
         default_factory=lambda: re.compile(r"\('([^']+)' was unexpected\)")
     )
+    # instantiate by jq rather than python
+    use_jq: bool = False
+    validators: ValidatorCache = field(
+        default_factory=ValidatorCache, init=False, repr=False, compare=False
+    )
 
     @classmethod
     def from_queries(
@@ -487,13 +959,22 @@ class SchemaLinter(Linter):
         query = cls.queries_to_query(language, queries, "schema.scm")
 
         if isinstance(schema_getter, str):
-            with open(schema_getter) as f:
-                schema = json.load(f)
+            schema_file = os.path.abspath(schema_getter)
 
-            def schema_getter(_: str):
-                return schema
+            def load() -> Any:
+                with open(schema_file) as f:
+                    return json.load(f)
 
-        return cls.from_schema(query, schema_getter)
+            schema = load()
+
+            # reload the schema after it is changed
+            def schema_getter(path: str):
+                if not linter.files.enabled:
+                    return schema
+                return linter.files.get(schema_file, path, load)
+
+        linter = cls.from_schema(query, schema_getter)
+        return linter
 
     @classmethod
     def from_schema(
@@ -511,9 +992,33 @@ class SchemaLinter(Linter):
 
         def validator_getter(path: str) -> Validator | None:
             schema = schema_getter(path)
-            return validator_for(schema)(schema) if schema else None
+            return linter.validators.get(schema) if schema else None
+
+        linter = cls(query, validator_getter)
+        return linter
 
-        return cls(query, validator_getter)
+    def invalidate(self, paths: list[str]) -> set[str]:
+        r"""Invalidate the cached values and validators of changed files.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: set[str]
+        """
+        documents = super().invalidate(paths)
+        if documents:
+            self.validators.invalidate()
+        return documents
+
+    def warm(self, path: str) -> None:
+        r"""Build the validator.
+
+        :param self:
+        :param path: the path of the workspace
+        :type path: str
+        :rtype: None
+        """
+        self.validator_getter(path)
 
     @staticmethod
     def tuple_is_range(tup) -> bool:
@@ -558,16 +1063,15 @@ class SchemaLinter(Linter):
         if validator is None:
             return []
         matches = self.cursor.matches(tree.root_node)
-        text_instance = self.instantiate(matches, NodeText)
-        tuple_instance = self.instantiate(matches, NodeTuples)
+        text_instance, tuple_instance = self.instantiate_all(
+            matches, [NodeText, NodeTuples]
+        )
         items = []
-        for error in validator.iter_errors(text_instance):
-            # strip $
-            code = error.json_path[1:].replace("'", '"')
-            if len(code) == 0 or code[0] != ".":
-                code = "." + code
-            program = jq.compile(code)
-            tup = program.input_value(tuple_instance).first()
+        with metrics.time("jsonschema.validate"):
+            errors = list(validator.iter_errors(text_instance))
+        ranges = self.get_ranges(tuple_instance) if errors else {}
+        for error in errors:
+            tup = ranges.get(tuple(error.absolute_path))
 
             def tuple_to_item(tup, error=error):
                 range = NodeRange.from_tuples(tup)
@@ -583,9 +1087,9 @@ class SchemaLinter(Linter):
             ):
                 # https://github.com/python-jsonschema/jsonschema/issues/1363
                 if error.message.endswith(" has non-unique elements"):
-                    texts: list[str] = program.input_value(
-                        text_instance
-                    ).first()
+                    texts: list[str] = Args.get_by_path(
+                        text_instance, list(error.absolute_path)
+                    )
                     for i in self.get_duplications(texts):
                         items += [tuple_to_item(tup[i])]
                 else:
@@ -605,6 +1109,26 @@ class SchemaLinter(Linter):
                 items += [tuple_to_item([[0, 0], [0, 0]])]
         return items
 
+    @classmethod
+    def get_ranges(cls, instance) -> dict[tuple[str | int, ...], Any]:
+        r"""Get a flat index from the paths of a range instance to its
+        values, so an error is mapped to ranges by one lookup.
+
+        :param cls:
+        :param instance:
+        :rtype: dict[tuple[str | int, ...], Any]
+        """
+        ranges = {}
+        stack: list[tuple[tuple[str | int, ...], Any]] = [((), instance)]
+        while stack:
+            path, value = stack.pop()
+            ranges[path] = value
+            if isinstance(value, dict):
+                stack += [((*path, k), v) for k, v in value.items()]
+            elif isinstance(value, list) and not cls.tuple_is_range(value):
+                stack += [((*path, i), v) for i, v in enumerate(value)]
+        return ranges
+
     @staticmethod
     def get_duplications(arr: list) -> list[int]:
         r"""Get duplications.
@@ -643,6 +1167,51 @@ class SchemaLinter(Linter):
                 values[key] = value or ""
         return args, values
 
+    def get_by_path(self, args: Args, instance, path: list[str | int]):
+        r"""Get by path with python or jq.
+
+        :param self:
+        :param args:
+        :type args: Args
+        :param instance:
+        :param path:
+        :type path: list[str | int]
+        """
+        if self.use_jq:
+            return args.get_by_code(instance, args.path_to_code(path))
+        return args.get_by_path(instance, path)
+
+    def get_len_by_path(
+        self, args: Args, instance, path: list[str | int]
+    ) -> int:
+        r"""Get len by path with python or jq.
+
+        :param self:
+        :param args:
+        :type args: Args
+        :param instance:
+        :param path:
+        :type path: list[str | int]
+        :rtype: int
+        """
+        result = self.get_by_path(args, instance, path)
+        return len(result) if isinstance(result, list) else 0
+
+    def set_by_path(self, args: Args, instance, path: list[str | int], obj):
+        r"""Set by path with python or jq.
+
+        :param self:
+        :param args:
+        :type args: Args
+        :param instance:
+        :param path:
+        :type path: list[str | int]
+        :param obj:
+        """
+        if self.use_jq:
+            return args.set_by_code(instance, args.path_to_code(path), obj)
+        return args.set_by_path(instance, path, obj)
+
     def instantiate(
         self,
         matches: list[tuple[int, dict[str, list[Node]]]],
@@ -656,7 +1225,24 @@ class SchemaLinter(Linter):
         :param callback:
         :type callback: Callable[[Node], Any]
         """
-        instance = {}
+        return self.instantiate_all(matches, [callback])[0]
+
+    def instantiate_all(
+        self,
+        matches: list[tuple[int, dict[str, list[Node]]]],
+        callbacks: list[Callable[[Node], Any]],
+    ) -> list[Any]:
+        r"""Get JSON instances of callbacks in one pass. Keys are parsed
+        once for all instances because they have the same structure.
+
+        :param self:
+        :param matches:
+        :type matches: list[tuple[int, dict[str, list[Node]]]]
+        :param callbacks:
+        :type callbacks: list[Callable[[Node], Any]]
+        :rtype: list[Any]
+        """
+        instances: list[Any] = [{} for _ in callbacks]
         for i, match in matches:
             # build args
             args, values = self.process_settings(
@@ -668,21 +1254,37 @@ class SchemaLinter(Linter):
                     if key.startswith("--") and key != "--":
                         args[key[2:]] = NodeText(node)
                     else:
-                        objs += [(key, callback(node))]
+                        objs += [
+                            (key, [callback(node) for callback in callbacks])
+                        ]
             args = Args(**args)
 
             # keep invariable for each match
-            lens: dict[str, int] = {}
-            for key, obj in objs:
-                code, obj_type = args.parse_key(key, lens, instance)
-                if isinstance(obj, str):
-                    with suppress(ValueError):
-                        obj = obj_type(obj)
-                instance = args.set_by_code(instance, code, obj)
+            lens: dict[tuple[str | int, ...], int] = {}
+            for key, objs_ in objs:
+                path, obj_type = args.parse_path(
+                    key,
+                    lens,
+                    partial(self.get_len_by_path, args, instances[0]),
+                )
+                for j, obj in enumerate(objs_):
+                    if isinstance(obj, str):
+                        with suppress(ValueError):
+                            obj = obj_type(obj)
+                    instances[j] = self.set_by_path(
+                        args, instances[j], path, obj
+                    )
             for key, obj in values.items():
-                code, obj_type = args.parse_key(key, lens, instance)
-                if args.has_by_code(instance, code):
+                path, obj_type = args.parse_path(
+                    key,
+                    lens,
+                    partial(self.get_len_by_path, args, instances[0]),
+                )
+                if self.get_by_path(args, instances[0], path) is not None:
                     continue
                 obj = obj_type(obj)
-                instance = args.set_by_code(instance, code, obj)
-        return instance
+                instances = [
+                    self.set_by_path(args, instance, path, obj)
+                    for instance in instances
+                ]
+        return instances
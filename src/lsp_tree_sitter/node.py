@@ -216,6 +216,17 @@ class PackageSearcher(NodeFilter):
         """
         raise NotImplementedError
 
+    def invalidate(self, paths: list[str]) -> bool:
+        r"""Invalidate the cached lookups depending on changed files. Return
+        whether any lookup has been invalidated.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: bool
+        """
+        return False
+
     @staticmethod
     def get_filetype(path: str, filetypes: Iterable[str]) -> str | None:
         r"""Get filetype.
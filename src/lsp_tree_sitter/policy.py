@@ -0,0 +1,64 @@
+r"""Policy
+==========
+
+Reduce the work of linters and completers for large documents.
+"""
+
+from dataclasses import dataclass
+from typing import Literal
+
+from tree_sitter import Tree
+
+Action = Literal["full", "sample", "off"]
+
+
+@dataclass(frozen=True)
+class Policy:
+    r"""Policy of a linter or a completer class for large documents.
+
+    Above any threshold, ``off`` skips the linter or the completer, and
+    ``sample`` makes an incremental linter only lint the first
+    :attr:`sample_bytes` bytes. A request with its own range, such as inlay
+    hints, isn't sampled. Features which cannot be sampled are skipped.
+    """
+
+    # 0 means unlimited
+    max_bytes: int = 0
+    max_lines: int = 0
+    action: Action = "off"
+    sample_bytes: int = 1024 * 1024
+
+    def get_action(self, size: int, lines: int) -> Action:
+        r"""Get the action for a document.
+
+        :param self:
+        :param size: the number of bytes
+        :type size: int
+        :param lines: the number of lines
+        :type lines: int
+        :rtype: Action
+        """
+        if 0 < self.max_bytes < size or 0 < self.max_lines < lines:
+            return self.action
+        return "full"
+
+    def get_tree_action(self, tree: Tree) -> Action:
+        r"""Get the action for the document of a tree.
+
+        :param self:
+        :param tree:
+        :type tree: Tree
+        :rtype: Action
+        """
+        # accessing Point.row breaks Node.text later in tree-sitter 0.26
+        return self.get_action(
+            tree.root_node.end_byte, tuple(tree.root_node.end_point)[0] + 1
+        )
+
+    def get_ranges(self) -> list[tuple[int, int]]:
+        r"""Get the byte ranges of ``sample``.
+
+        :param self:
+        :rtype: list[tuple[int, int]]
+        """
+        return [(0, self.sample_bytes)]
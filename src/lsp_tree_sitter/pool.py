@@ -0,0 +1,99 @@
+r"""Pool
+========
+
+Share parsers between threads.
+"""
+
+from collections.abc import Generator
+from contextlib import contextmanager
+from queue import SimpleQueue
+from threading import Lock
+
+from tree_sitter import Parser, Tree
+
+from .metrics import metrics
+
+
+class ParserPool:
+    r"""Parser pool.
+
+    A ``Parser`` cannot be used by two threads at the same time. A thread
+    checks out an idle parser, or a new parser of the same language if there
+    is none, and returns it after parsing.
+    """
+
+    def __init__(self, parser: Parser, max_size: int = 0) -> None:
+        r"""Init.
+
+        :param self:
+        :param parser: the template of other parsers
+        :type parser: Parser
+        :param max_size: wait for an idle parser when ``max_size`` parsers
+            have been created. 0 means unlimited
+        :type max_size: int
+        :rtype: None
+        """
+        self.parser = parser
+        self.max_size = max_size
+        self.size = 1
+        self.idle: SimpleQueue[Parser] = SimpleQueue()
+        self.idle.put(parser)
+        self.lock = Lock()
+
+    def new(self) -> Parser:
+        r"""Create a parser like the template.
+
+        :param self:
+        :rtype: Parser
+        """
+        parser = Parser(self.parser.language)
+        if self.parser.included_ranges:
+            parser.included_ranges = self.parser.included_ranges
+        return parser
+
+    def acquire(self) -> Parser:
+        r"""Check out a parser.
+
+        :param self:
+        :rtype: Parser
+        """
+        if self.idle.empty():
+            with self.lock:
+                if self.max_size <= 0 or self.size < self.max_size:
+                    self.size += 1
+                    return self.new()
+        return self.idle.get()
+
+    def release(self, parser: Parser) -> None:
+        r"""Return a parser.
+
+        :param self:
+        :param parser:
+        :type parser: Parser
+        :rtype: None
+        """
+        self.idle.put(parser)
+
+    @contextmanager
+    def checkout(self) -> Generator[Parser, None, None]:
+        r"""Check out a parser and return it after use.
+
+        :param self:
+        :rtype: Generator[Parser, None, None]
+        """
+        parser = self.acquire()
+        try:
+            yield parser
+        finally:
+            self.release(parser)
+
+    def parse(self, source: bytes) -> Tree:
+        r"""Parse a source with a parser in the pool.
+
+        :param self:
+        :param source:
+        :type source: bytes
+        :rtype: Tree
+        """
+        with self.checkout() as parser, metrics.time("parse"):
+            return parser.parse(source)
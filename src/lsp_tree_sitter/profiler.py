@@ -0,0 +1,218 @@
+r"""Profiler
+============
+
+Profile requests with :mod:`cProfile` and :mod:`tracemalloc` on demand.
+"""
+
+import os
+import tracemalloc
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from cProfile import Profile
+from functools import wraps
+from inspect import iscoroutinefunction
+from threading import Lock
+from time import perf_counter, time
+from typing import Any, TypeVar
+from urllib.parse import quote
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Profiler:
+    r"""Profiler.
+
+    It profiles the next :attr:`count` requests, and all requests slower
+    than :attr:`threshold` seconds. Each profiled request writes a
+    ``.prof`` file for :mod:`pstats` and a ``.txt`` file of memory
+    allocations named by the time, the method and the document URI to
+    :attr:`directory`. When neither is set, a request only pays for a
+    comparison.
+    """
+
+    # limit of file names
+    max_name: int = 200
+    # lines of memory allocations
+    max_stats: int = 30
+
+    def __init__(
+        self, directory: str, count: int = 0, threshold: float = 0.0
+    ) -> None:
+        r"""Init.
+
+        :param self:
+        :param directory:
+        :type directory: str
+        :param count: profile the next requests
+        :type count: int
+        :param threshold: profile requests slower than it. 0 means no
+        :type threshold: float
+        :rtype: None
+        """
+        self.directory = directory
+        self.count = count
+        self.threshold = threshold
+        self.lock = Lock()
+        # cProfile is global since python 3.12, so only one request is
+        # profiled at a time
+        self.active = False
+        # whether tracemalloc is started by the profiler
+        self.tracing = False
+
+    @classmethod
+    def from_environ(cls, directory: str) -> "Profiler":
+        r"""Create a profiler from ``LSP_TREE_SITTER_PROFILE_COUNT``,
+        ``LSP_TREE_SITTER_PROFILE_THRESHOLD`` and
+        ``LSP_TREE_SITTER_PROFILE_DIR``.
+
+        :param cls:
+        :param directory: the default directory
+        :type directory: str
+        :rtype: Profiler
+        """
+        return cls(
+            os.getenv("LSP_TREE_SITTER_PROFILE_DIR") or directory,
+            int(os.getenv("LSP_TREE_SITTER_PROFILE_COUNT") or 0),
+            float(os.getenv("LSP_TREE_SITTER_PROFILE_THRESHOLD") or 0),
+        )
+
+    def start(
+        self, count: int = 1, threshold: float = 0.0, directory: str = ""
+    ) -> dict[str, Any]:
+        r"""Profile the next requests or slow requests. Return the state.
+
+        :param self:
+        :param count:
+        :type count: int
+        :param threshold:
+        :type threshold: float
+        :param directory: keep the current directory if it is empty
+        :type directory: str
+        :rtype: dict[str, Any]
+        """
+        with self.lock:
+            self.count = count
+            self.threshold = threshold
+            self.directory = directory or self.directory
+        return {
+            "directory": self.directory,
+            "count": self.count,
+            "threshold": self.threshold,
+        }
+
+    def get_prefix(self, method: str, uri: str) -> str:
+        r"""Get the prefix of the files of a profile.
+
+        :param self:
+        :param method:
+        :type method: str
+        :param uri:
+        :type uri: str
+        :rtype: str
+        """
+        name = f"{time():.3f}-{method.replace('/', '.')}"
+        if uri:
+            name += "-" + quote(uri, safe="")
+        return os.path.join(self.directory, name[: self.max_name])
+
+    @contextmanager
+    def profile(
+        self, method: str, uri: str = ""
+    ) -> Generator[None, None, None]:
+        r"""Profile a block if it is requested. A block isn't profiled when
+        another block is being profiled, including a block in it.
+
+        :param self:
+        :param method:
+        :type method: str
+        :param uri:
+        :type uri: str
+        :rtype: Generator[None, None, None]
+        """
+        if (self.count <= 0 and self.threshold <= 0) or self.active:
+            yield
+            return
+        with self.lock:
+            threshold = self.threshold
+            if self.active:
+                # profiled by another thread
+                forced: bool | None = None
+            elif self.count > 0:
+                self.count -= 1
+                forced = True
+            elif threshold > 0:
+                forced = False
+            else:
+                # stopped by another thread
+                forced = None
+            if forced is not None:
+                self.active = True
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self.tracing = True
+        if forced is None:
+            yield
+            return
+        profile: Profile | None = None
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            start = perf_counter()
+            profile = Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiling tool is active
+                profile = None
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                elapsed = perf_counter() - start
+                stats = tracemalloc.take_snapshot().compare_to(
+                    snapshot, "lineno"
+                )
+                _, peak = tracemalloc.get_traced_memory()
+            with self.lock:
+                if self.tracing:
+                    tracemalloc.stop()
+                    self.tracing = False
+                self.active = False
+            if profile is not None and (forced or elapsed >= threshold):
+                prefix = self.get_prefix(method, uri)
+                os.makedirs(self.directory, exist_ok=True)
+                profile.dump_stats(prefix + ".prof")
+                with open(prefix + ".txt", "w") as f:
+                    f.write(
+                        f"method: {method}\nuri: {uri}\n"
+                        f"seconds: {elapsed}\npeak bytes: {peak}\n\n"
+                    )
+                    f.writelines(
+                        f"{stat}\n" for stat in stats[: self.max_stats]
+                    )
+
+    def profiled(self, method: str) -> Callable[[F], F]:
+        r"""Profile a handler. The URI is got from the text document of its
+        parameters. A coroutine function isn't profiled because the event
+        loop runs other requests during awaiting, so its jobs in executors
+        should be profiled by :meth:`profile`.
+
+        :param self:
+        :param method:
+        :type method: str
+        :rtype: Callable[[F], F]
+        """
+
+        def decorator(function: F) -> F:
+            if iscoroutinefunction(function):
+                return function
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                params = args[0] if args else None
+                document = getattr(params, "text_document", None)
+                with self.profile(method, getattr(document, "uri", "")):
+                    return function(*args, **kwargs)
+
+            return wrapper  # type: ignore
+
+        return decorator
@@ -0,0 +1,144 @@
+r"""Scheduler
+=============
+
+Debounce and coalesce the jobs of documents.
+"""
+
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Executor
+from threading import Event
+from typing import Any
+
+
+class Scheduler:
+    r"""Scheduler.
+
+    A job scheduled for a URI replaces the pending job of the URI, so a burst
+    of changes only runs the last job after the debounce window. A job
+    submitted for a URI cancels the job of the URI running in the executor.
+    """
+
+    def __init__(
+        self, delay: float = 0.0, executor: Executor | None = None
+    ) -> None:
+        r"""Init.
+
+        :param self:
+        :param delay: debounce window in seconds
+        :type delay: float
+        :param executor: run submitted jobs in it
+        :type executor: Executor | None
+        :rtype: None
+        """
+        self.delay = delay
+        self.executor = executor
+        self.handles: dict[str, asyncio.TimerHandle] = {}
+        self.jobs: dict[str, tuple[asyncio.Future, Event]] = {}
+
+    @staticmethod
+    def get_running_loop() -> asyncio.AbstractEventLoop | None:
+        r"""Get the running event loop. Return ``None`` when there is no
+        running event loop, such as ``--check``.
+
+        :rtype: asyncio.AbstractEventLoop | None
+        """
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def schedule(self, uri: str, callback: Callable[[], None]) -> None:
+        r"""Schedule a job. Without a running event loop, run it
+        immediately.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param callback:
+        :type callback: Callable[[], None]
+        :rtype: None
+        """
+        self.cancel(uri)
+        loop = self.get_running_loop()
+        if loop is None or self.delay <= 0:
+            callback()
+            return
+        self.handles[uri] = loop.call_later(
+            self.delay, self.run, uri, callback
+        )
+
+    def run(self, uri: str, callback: Callable[[], None]) -> None:
+        r"""Run a scheduled job.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param callback:
+        :type callback: Callable[[], None]
+        :rtype: None
+        """
+        self.handles.pop(uri, None)
+        callback()
+
+    def submit(
+        self,
+        uri: str,
+        function: Callable[[Event], Any],
+        callback: Callable[[Any], None],
+    ) -> None:
+        r"""Run ``function`` in the executor and pass its result to
+        ``callback`` in the event loop. Without a running event loop or an
+        executor, run them immediately.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param function: the event will be set when the job is cancelled.
+            It isn't called if the job is cancelled before it starts
+        :type function: Callable[[Event], Any]
+        :param callback: isn't called when the job is cancelled
+        :type callback: Callable[[Any], None]
+        :rtype: None
+        """
+        self.cancel(uri)
+        event = Event()
+        loop = self.get_running_loop()
+        if loop is None or self.executor is None:
+            callback(function(event))
+            return
+
+        def run() -> Any:
+            # cancelling the future only reaches the executor in the next
+            # iteration of the event loop
+            if event.is_set():
+                return None
+            return function(event)
+
+        future = loop.run_in_executor(self.executor, run)
+        self.jobs[uri] = future, event
+
+        def done(future: asyncio.Future) -> None:
+            if self.jobs.get(uri, (None,))[0] is future:
+                del self.jobs[uri]
+            if future.cancelled() or event.is_set():
+                return
+            callback(future.result())
+
+        future.add_done_callback(done)
+
+    def cancel(self, uri: str) -> None:
+        r"""Cancel the pending job and the running job of a URI.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: None
+        """
+        handle = self.handles.pop(uri, None)
+        if handle is not None:
+            handle.cancel()
+        future, event = self.jobs.pop(uri, (None, None))
+        if future is not None and event is not None:
+            event.set()
+            future.cancel()
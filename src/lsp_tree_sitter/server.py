@@ -2,11 +2,24 @@ r"""Server
 ==========
 """
 
+import json
+import os
 import sys
-from typing import TYPE_CHECKING
+from collections.abc import Callable, Generator, Sequence
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import asdict
+from itertools import count
+from threading import Event
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, overload
+from urllib.parse import unquote
+from uuid import uuid4
 
 from lsprotocol.types import (
+    EXIT,
+    INITIALIZED,
     TEXT_DOCUMENT_COMPLETION,
+    TEXT_DOCUMENT_DIAGNOSTIC,
     TEXT_DOCUMENT_DID_CHANGE,
     TEXT_DOCUMENT_DID_CLOSE,
     TEXT_DOCUMENT_DID_OPEN,
@@ -14,42 +27,308 @@ from lsprotocol.types import (
     TEXT_DOCUMENT_DOCUMENT_SYMBOL,
     TEXT_DOCUMENT_HOVER,
     TEXT_DOCUMENT_INLAY_HINT,
+    TEXT_DOCUMENT_PUBLISH_DIAGNOSTICS,
+    WORKSPACE_DIAGNOSTIC,
+    WORKSPACE_DID_CHANGE_WATCHED_FILES,
     CompletionList,
     CompletionParams,
     Diagnostic,
+    DiagnosticOptions,
     DiagnosticSeverity,
     DidChangeTextDocumentParams,
+    DidChangeWatchedFilesParams,
+    DidChangeWatchedFilesRegistrationOptions,
     DidCloseTextDocumentParams,
     DidOpenTextDocumentParams,
+    DocumentDiagnosticParams,
+    DocumentDiagnosticReport,
     DocumentLink,
     DocumentLinkParams,
     DocumentSymbol,
     DocumentSymbolParams,
+    FileSystemWatcher,
     Hover,
+    InitializedParams,
     InlayHint,
     InlayHintParams,
+    LogMessageParams,
     MarkupContent,
     MarkupKind,
+    MessageType,
     PublishDiagnosticsParams,
+    Range,
+    Registration,
+    RegistrationParams,
+    RelatedFullDocumentDiagnosticReport,
+    RelatedUnchangedDocumentDiagnosticReport,
+    ShowMessageParams,
+    TextDocumentContentChangeEvent,
     TextDocumentContentChangePartial,
     TextDocumentPositionParams,
+    VersionedTextDocumentIdentifier,
+    WorkDoneProgressBegin,
+    WorkDoneProgressEnd,
+    WorkDoneProgressReport,
+    WorkspaceDiagnosticParams,
+    WorkspaceDiagnosticReport,
+    WorkspaceFullDocumentDiagnosticReport,
+    WorkspaceUnchangedDocumentDiagnosticReport,
 )
 from pygls.lsp.server import LanguageServer
-from pygls.uris import to_fs_path
+from pygls.protocol import LanguageServerProtocol, lsp_method
+from pygls.uris import from_fs_path, to_fs_path
 from pygls.workspace import ServerTextPosition, TextDocument
-from tree_sitter import Parser, Tree
+from tree_sitter import Parser, Point, Tree
 
+from .cache import (
+    DiagnosticCache,
+    FileCache,
+    InvalidationBus,
+    ResultCache,
+)
 from .completer import Completer
-from .linter import Linter, SchemaLinter
+from .indexer import WorkspaceIndexer
+from .linter import CaptureDispatcher, Linter, LinterBase, SchemaLinter
+from .metrics import F, metrics
 from .node import NodeText
+from .policy import Action
+from .pool import ParserPool
+from .profiler import Profiler
+from .scheduler import Scheduler
+from .session import SessionRecorder, SessionReplayer
+from .store import TextBuffer, TextRope, TextStore, TreeStore
 from .utils import pprint
 
 if TYPE_CHECKING:
     from argparse import Namespace
 
 
+class TextLines(Sequence[str]):
+    r"""Lines of a :class:`TreeSitterTextDocument`, decoded on demand."""
+
+    def __init__(self, document: "TreeSitterTextDocument") -> None:
+        r"""Init.
+
+        :param self:
+        :param document:
+        :type document: TreeSitterTextDocument
+        :rtype: None
+        """
+        self.document = document
+
+    def __len__(self) -> int:
+        r"""Len.
+
+        :param self:
+        :rtype: int
+        """
+        return self.document.store.get_line_count()
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        r"""Get a line with ``\n``.
+
+        :param self:
+        :param index:
+        :type index: int | slice
+        :rtype: str | list[str]
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.document.get_line(index, True)
+
+
 class TreeSitterTextDocument(TextDocument):
-    r"""TextDocument for tree sitter."""
+    r"""TextDocument for tree sitter.
+
+    The UTF-8 source in a :class:`~lsp_tree_sitter.store.TextStore` is the
+    primary storage. Incremental changes are spliced into it in place and
+    tree sitter parses it directly. The text is only decoded when it is
+    required. Sources larger than :attr:`rope_threshold` bytes are stored in
+    a :class:`~lsp_tree_sitter.store.TextRope`.
+    """
+
+    rope_threshold: int = 4 * 1024 * 1024
+    # the deadline of parsing is checked when each chunk is read
+    read_size: int = 1024
+
+    def __init__(self, *args, **kwargs) -> None:
+        r"""Init.
+
+        :param self:
+        :param args:
+        :param kwargs:
+        :rtype: None
+        """
+        super().__init__(*args, **kwargs)
+        self._store: TextStore | None = None
+        self._text: str | None = None
+        # seconds of the last parsing
+        self.parse_time = 0.0
+        # whether the last parsing ran out of the budget
+        self.degraded = False
+
+    @property
+    def store(self) -> TextStore:
+        r"""UTF-8 source.
+
+        :param self:
+        :rtype: TextStore
+        """
+        if self._store is None:
+            self._store = self.new_store(super().source.encode())
+            # the store will be the only storage
+            self._source = None
+        return self._store
+
+    @classmethod
+    def new_store(cls, data: bytes) -> TextStore:
+        r"""Create a store for a UTF-8 source.
+
+        :param cls:
+        :param data:
+        :type data: bytes
+        :rtype: TextStore
+        """
+        return (
+            TextRope(data)
+            if len(data) > cls.rope_threshold
+            else TextBuffer(data)
+        )
+
+    @classmethod
+    def from_bytes(
+        cls, uri: str, data: bytes, *args, **kwargs
+    ) -> "TreeSitterTextDocument":
+        r"""Create a document from a UTF-8 source without decoding it.
+
+        :param cls:
+        :param uri:
+        :type uri: str
+        :param data:
+        :type data: bytes
+        :param args:
+        :param kwargs:
+        :rtype: TreeSitterTextDocument
+        """
+        document = cls(uri, None, *args, **kwargs)
+        document._store = cls.new_store(data)
+        return document
+
+    @property
+    def source(self) -> str:
+        r"""Source.
+
+        :param self:
+        :rtype: str
+        """
+        if self._text is None:
+            self._text = bytes(self.store).decode()
+        return self._text
+
+    @property
+    def lines(self) -> TextLines:
+        r"""Lines. Like tree sitter, only ``\n`` starts a new line.
+
+        :param self:
+        :rtype: TextLines
+        """
+        return TextLines(self)
+
+    def get_line(self, line: int, keepends: bool = False) -> str:
+        r"""Get a line.
+
+        :param self:
+        :param line:
+        :type line: int
+        :param keepends: keep ``\n``
+        :type keepends: bool
+        :rtype: str
+        """
+        store = self.store
+        start = store.get_line_start(line)
+        end = (
+            store.get_line_start(line + 1) - (0 if keepends else 1)
+            if line + 1 < store.get_line_count()
+            else len(store)
+        )
+        return store.get_bytes(start, end).decode()
+
+    def parse(
+        self,
+        parser: Parser,
+        old_tree: Tree | None = None,
+        timeout: float = 0.0,
+    ) -> Tree:
+        r"""Parse the UTF-8 source. If the parsing takes more than
+        ``timeout`` seconds, the input is ended, the tree of the source read
+        so far is returned and the document is degraded.
+
+        The progress callback of ``Parser.parse()`` is unavailable for
+        ``tree-sitter<0.25`` and breaks ``Node.text`` of the tree, so the
+        read callback checks the deadline and ends the input. The deadline
+        is only checked when a chunk of :attr:`read_size` bytes is read, so
+        it doesn't bound a slow parsing of a small source.
+
+        ``Node.text`` of a tree parsed by a read callback calls it again, so
+        a buffer, or the source read so far, is parsed again without edits,
+        which reuses the whole tree and gives the tree the buffer.
+
+        :param self:
+        :param parser:
+        :type parser: Parser
+        :param old_tree:
+        :type old_tree: Tree | None
+        :param timeout: 0 means unlimited
+        :type timeout: float
+        :rtype: Tree
+        """
+        source = self.store.source
+        kwargs = {}
+        # TypeError: parse() argument 2 must be tree_sitter.Tree, not None
+        if old_tree is not None:
+            kwargs["old_tree"] = old_tree
+        self.degraded = False
+        if timeout <= 0:
+            return parser.parse(source, **kwargs)
+        deadline = perf_counter() + timeout
+        # the end of the input
+        end = size = len(self.store)
+
+        def read(byte_offset: int, point: Point) -> bytes:
+            nonlocal deadline, end
+            if deadline and perf_counter() > deadline:
+                # end the input to stop the parsing. an exception raised
+                # here would be left set for the next call
+                deadline = 0
+                end = min(byte_offset, end)
+            if byte_offset >= end:
+                return b""
+            if callable(source):
+                return source(byte_offset, point)[: end - byte_offset]
+            # read callback must return bytes
+            return bytes(
+                source[byte_offset : min(byte_offset + self.read_size, end)]
+            )
+
+        tree = parser.parse(read, **kwargs)
+        # the tree reads the source lazily after parsing
+        deadline = 0
+        if end < size:
+            self.degraded = True
+            return parser.parse(self.store.get_bytes(0, end), old_tree=tree)
+        if not callable(source):
+            return parser.parse(source, old_tree=tree)
+        return tree
 
     def position_to_byte_offset(
         self, position: ServerTextPosition
@@ -66,17 +345,58 @@ class TreeSitterTextDocument(TextDocument):
         :rtype: tuple[int, int]
         """
         # index out of length
-        lines = self.source.encode().split(b"\n")
-        line_start = sum(
-            len(lines[i]) + 1 for i in range(min(position.line, len(lines)))
-        )
-        if position.line >= len(lines):
-            return line_start, 0
-        line_str = lines[position.line].decode()
-        byte_col = len(
-            line_str[: min(position.character, len(line_str))].encode()
-        )
-        return line_start + byte_col, byte_col
+        if position.line >= self.store.get_line_count():
+            return len(self.store), 0
+        line_str = self.get_line(position.line)
+        byte_col = len(line_str[: position.character].encode())
+        return self.store.get_line_start(position.line) + byte_col, byte_col
+
+    def get_byte_range(self, range: Range) -> tuple[int, int]:
+        r"""Convert a range in client units to a byte range.
+
+        :param self:
+        :param range:
+        :type range: Range
+        :rtype: tuple[int, int]
+        """
+        range = self.range_from_client_units(range)
+        start_byte, _ = self.position_to_byte_offset(range.start)
+        end_byte, _ = self.position_to_byte_offset(range.end)
+        return start_byte, end_byte
+
+    def apply_change(self, change: TextDocumentContentChangeEvent) -> None:
+        r"""Apply a change.
+
+        :param self:
+        :param change:
+        :type change: TextDocumentContentChangeEvent
+        :rtype: None
+        """
+        if (
+            isinstance(change, TextDocumentContentChangePartial)
+            and self._is_sync_kind_incremental
+        ):
+            self.apply_tree_edit(self.compute_tree_edit(change), change.text)
+            return
+        super().apply_change(change)
+        self._store = None
+        self._text = None
+
+    def apply_tree_edit(self, edit: dict, text: str) -> None:
+        r"""Splice the text of a change into the UTF-8 source.
+
+        :param self:
+        :param edit: returned by :meth:`compute_tree_edit`
+        :type edit: dict
+        :param text:
+        :type text: str
+        :rtype: None
+        """
+        store = self.store
+        store.splice(edit["start_byte"], edit["old_end_byte"], text.encode())
+        if isinstance(store, TextBuffer) and len(store) > self.rope_threshold:
+            self._store = TextRope(bytes(store))
+        self._text = None
 
     def compute_tree_edit(
         self, change: TextDocumentContentChangePartial
@@ -89,10 +409,7 @@ class TreeSitterTextDocument(TextDocument):
         :type change: TextDocumentContentChangePartial
         :rtype: dict
         """
-        lines = self.source.splitlines(True)
-        range = self.position_codec.range_from_client_units(
-            lines, change.range
-        )
+        range = self.range_from_client_units(change.range)
 
         start_byte, start_bcol = self.position_to_byte_offset(range.start)
         old_end_byte, old_end_bcol = self.position_to_byte_offset(range.end)
@@ -117,9 +434,85 @@ class TreeSitterTextDocument(TextDocument):
         )
 
 
+class TreeSitterProtocol(LanguageServerProtocol):
+    r"""Language server protocol. The workspace shares the
+    :class:`TreeSitterTextDocument` of an open document with the server,
+    instead of storing another copy of the text and applying every change to
+    it.
+    """
+
+    _server: "TreeSitterLanguageServer"
+
+    @lsp_method(TEXT_DOCUMENT_DID_OPEN)
+    def lsp_text_document__did_open(
+        self, params: DidOpenTextDocumentParams
+    ) -> Generator[Any, Any, None]:
+        r"""Open a document in the server, then share it with the workspace.
+
+        :param self:
+        :param params:
+        :type params: DidOpenTextDocumentParams
+        :rtype: Generator[Any, Any, None]
+        """
+        handler = self.fm.features.get(TEXT_DOCUMENT_DID_OPEN)
+        if handler is not None:
+            yield handler, (params,), None
+        uri = params.text_document.uri
+        document = self._server.documents.get(uri)
+        if document is None:
+            self.workspace.put_text_document(params.text_document)
+        else:
+            self.workspace.text_documents[unquote(uri)] = document
+
+    @lsp_method(TEXT_DOCUMENT_DID_CHANGE)
+    def lsp_text_document__did_change(
+        self, params: DidChangeTextDocumentParams
+    ) -> Generator[Any, Any, None]:
+        r"""Change a document. The changes of a document shared with the
+        server are only applied by the server.
+
+        :param self:
+        :param params:
+        :type params: DidChangeTextDocumentParams
+        :rtype: Generator[Any, Any, None]
+        """
+        uri = params.text_document.uri
+        document = self.workspace.text_documents.get(unquote(uri))
+        if document is not self._server.documents.get(uri):
+            for change in params.content_changes:
+                self.workspace.update_text_document(
+                    params.text_document, change
+                )
+        handler = self.fm.features.get(TEXT_DOCUMENT_DID_CHANGE)
+        if handler is not None:
+            yield handler, (params,), None
+
+
 class TreeSitterLanguageServer(LanguageServer):
     r"""Languageserver based tree sitter."""
 
+    # debounce window of diagnostics after changes in seconds
+    diagnose_delay: float = 0.2
+    # only lint the changed regions by incremental linters
+    incremental_diagnose: bool = False
+    # evict the least recently used trees out of these limits. 0 means
+    # unlimited
+    max_trees: int = 100
+    max_tree_bytes: int = 256 * 1024 * 1024
+    # budget of parsing a document in seconds. If it runs out, the document
+    # is degraded to the tree of the source parsed in time and expensive
+    # linters are skipped until it can be parsed in time. 0 means unlimited
+    parse_timeout: float = 5.0
+    # fnmatch patterns of the file names for workspace diagnostics. empty
+    # means workspace diagnostics are disabled
+    workspace_patterns: tuple[str, ...] = ()
+    # cache file of workspace diagnostics. empty means
+    # ``$XDG_CACHE_HOME/lsp-tree-sitter/{name}.json``
+    workspace_cache: str = ""
+    # glob patterns of the files to watch. Caches of linters and completers
+    # depending on files are only enabled when the client watches them
+    watched_patterns: tuple[str, ...] = ("**/*",)
+
     @staticmethod
     def get_name(parser: Parser) -> str:
         r"""Get name.
@@ -154,56 +547,173 @@ class TreeSitterLanguageServer(LanguageServer):
         :rtype: None
         """
         name = self.get_name(parser)
+        # protocol_cls follows version, text_document_sync_kind and
+        # notebook_document_sync
+        if len(args) < 4:
+            kwargs.setdefault("protocol_cls", TreeSitterProtocol)
         super().__init__(name, *args, **kwargs)
         self.parser = parser
+        self.parsers = ParserPool(parser)
         self.linters = linters
         self.completers = completers
-        self.trees: dict[str, Tree] = {}
+        self.dispatcher = CaptureDispatcher.from_linters(
+            parser.language, linters
+        )
+        self.documents: dict[str, TreeSitterTextDocument] = {}
+        self.trees = TreeStore(
+            lambda uri: self.parse(self.documents[uri]),
+            self.max_trees,
+            self.max_tree_bytes,
+            None if self.dispatcher is None else self.dispatcher.pop,
+        )
+        self.diagnostic_caches: dict[str, DiagnosticCache] = {}
+        self.results = ResultCache()
+        self.scheduler = Scheduler(self.diagnose_delay, self.thread_pool)
+        self.result_ids = count()
+        cache_dir = os.path.join(
+            os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+            "lsp-tree-sitter",
+        )
+        # a language can have no name
+        cache_name = name or "default"
+        cache_file = self.workspace_cache or os.path.join(
+            cache_dir, f"{cache_name}.json"
+        )
+        self.profiler = Profiler.from_environ(
+            os.path.join(cache_dir, "profiles", cache_name)
+        )
+        self.recorder: SessionRecorder | None = None
+        self.indexer = WorkspaceIndexer(
+            self, FileCache(cache_file, str(self.version))
+        )
+        self.invalidations = InvalidationBus()
+        for item in (*linters, *completers):
+            self.invalidations.subscribe(item.invalidate)
+
+        @self.feature(EXIT)
+        def _(*_) -> None:
+            # exit() doesn't return
+            self.indexer.shutdown()
+            if self.recorder is not None:
+                self.recorder.close()
+
+        @self.feature(INITIALIZED)
+        async def _(params: InitializedParams) -> None:
+            await self.watch_files()
+            self.thread_pool.submit(self.warm)
+
+        @self.feature(WORKSPACE_DID_CHANGE_WATCHED_FILES)
+        def _(params: DidChangeWatchedFilesParams) -> None:
+            self.invalidate([
+                to_fs_path(change.uri) or "" for change in params.changes
+            ])
 
         @self.feature(TEXT_DOCUMENT_DID_OPEN)
         def _(params: DidOpenTextDocumentParams) -> None:
             uri = params.text_document.uri
-            source = params.text_document.text.encode()
-            self.trees[uri] = self.parser.parse(source)
+            document = TreeSitterTextDocument(
+                uri,
+                params.text_document.text,
+                params.text_document.version,
+                params.text_document.language_id,
+            )
+            self.documents[uri] = document
+            self.trees[uri] = self.parse(document)
+            self.diagnostic_caches[uri] = DiagnosticCache()
+            self.results.invalidate(uri)
             self.diagnose(params)
 
         @self.feature(TEXT_DOCUMENT_DID_CLOSE)
         def _(params: DidCloseTextDocumentParams) -> None:
             uri = params.text_document.uri
-            if uri in self.trees:
-                del self.trees[uri]
+            self.scheduler.cancel(uri)
+            self.documents.pop(uri, None)
+            self.trees.pop(uri)
+            if self.dispatcher is not None:
+                self.dispatcher.pop(uri)
+            self.diagnostic_caches.pop(uri, None)
+            self.results.invalidate(uri)
 
         @self.feature(TEXT_DOCUMENT_DID_CHANGE)
         def _(params: DidChangeTextDocumentParams) -> None:
             if len(params.content_changes) == 0:
                 return
             uri = params.text_document.uri
-            tree = self.trees.get(uri)
-            if tree is None:
-                doc = self.workspace.get_text_document(uri)
-            else:
-                doc = TreeSitterTextDocument(uri, NodeText(tree.root_node))
-
-                for change in params.content_changes:
-                    if not isinstance(
-                        change, TextDocumentContentChangePartial
-                    ):
-                        tree = None
-                        doc = TextDocument(uri, change.text)
-                        break
-                    edit = doc.compute_tree_edit(change)
+            document = self.documents.get(uri)
+            if document is None:
+                return
+            if self.dispatcher is not None:
+                self.dispatcher.pop(uri)
+            cache = self.diagnostic_caches.get(uri)
+            # None if it has been evicted or degraded
+            tree = (
+                None
+                if document.degraded or cache is None
+                else self.trees.get(uri)
+            )
+            for change in params.content_changes:
+                if (
+                    isinstance(change, TextDocumentContentChangePartial)
+                    and tree is not None
+                    and cache is not None
+                ):
+                    edit = document.compute_tree_edit(change)
                     tree.edit(**edit)
-                    doc.apply_change(change)
-            source = doc.source.encode()
+                    if self.incremental_diagnose:
+                        cache.edit(edit)
+                    document.apply_tree_edit(edit, change.text)
+                else:
+                    tree = None
+                    document.apply_change(change)
+            document.version = params.text_document.version
+            self.results.invalidate(uri)
+            new_tree = self.parse(document, tree)
+            self.trees[uri] = new_tree
+            if tree is None or cache is None:
+                self.diagnostic_caches[uri] = DiagnosticCache()
+            elif self.incremental_diagnose:
+                cache.add(tree.changed_ranges(new_tree))
+            self.scheduler.schedule(uri, lambda: self.diagnose(params))
 
-            # TypeError: parse() argument 2 must be tree_sitter.Tree, not None
-            tree = (
-                self.parser.parse(source, old_tree=tree)
-                if tree
-                else self.parser.parse(source)
+        @self.feature(
+            TEXT_DOCUMENT_DIAGNOSTIC,
+            DiagnosticOptions(
+                False, bool(self.workspace_patterns), identifier=name
+            ),
+        )
+        async def _(
+            params: DocumentDiagnosticParams,
+        ) -> DocumentDiagnosticReport:
+            return await self.pull_diagnose(params)
+
+        @self.feature(WORKSPACE_DIAGNOSTIC)
+        async def _(
+            params: WorkspaceDiagnosticParams,
+        ) -> WorkspaceDiagnosticReport:
+            return await self.workspace_diagnose(params)
+
+        @self.command(self.get_command("policy"))
+        def _(*_) -> dict[str, Any]:
+            return self.get_policies()
+
+        @self.command(self.get_command("metrics"))
+        def _(*_) -> dict[str, dict[str, float]]:
+            return self.get_metrics()
+
+        # pygls requires all parameters of a command, so the optional count,
+        # threshold and directory are parsed from variable arguments
+        @self.command(self.get_command("profile"))
+        def _(*args) -> dict[str, Any]:
+            defaults = 1, 0.0, ""
+            if len(args) > len(defaults):
+                raise TypeError(
+                    f"expected at most {len(defaults)} arguments, "
+                    f"got {len(args)}"
+                )
+            count, threshold, directory = *args, *defaults[len(args) :]
+            return self.profiler.start(
+                int(count), float(threshold), str(directory)
             )
-            self.trees[uri] = tree
-            self.diagnose(params)
 
         @self.feature(TEXT_DOCUMENT_DOCUMENT_LINK)
         def _(params: DocumentLinkParams) -> list[DocumentLink]:
@@ -225,11 +735,193 @@ class TreeSitterLanguageServer(LanguageServer):
         def completions(params: CompletionParams) -> CompletionList:
             return self.complete(params)
 
+    def feature(
+        self, feature_name: str, options: Any | None = None
+    ) -> Callable[[F], F]:
+        r"""Register a feature. Record the latencies of its handler and
+        profile it on demand.
+
+        :param self:
+        :param feature_name:
+        :type feature_name: str
+        :param options:
+        :type options: Any | None
+        :rtype: Callable[[F], F]
+        """
+        decorator = super().feature(feature_name, options)
+        return lambda function: decorator(
+            metrics.timed(feature_name)(
+                self.profiler.profiled(feature_name)(function)
+            )
+        )
+
+    def command(self, command_name: str) -> Callable[[F], F]:
+        r"""Register a command. Record the latencies of its handler and
+        profile it on demand.
+
+        :param self:
+        :param command_name:
+        :type command_name: str
+        :rtype: Callable[[F], F]
+        """
+        decorator = super().command(command_name)
+        return lambda function: decorator(
+            metrics.timed(command_name)(
+                self.profiler.profiled(command_name)(function)
+            )
+        )
+
+    def get_command(self, command: str) -> str:
+        r"""Get the name of a command prefixed by the name of the server.
+
+        :param self:
+        :param command:
+        :type command: str
+        :rtype: str
+        """
+        return f"{self.name}.{command}" if self.name else command
+
+    @property
+    def pull_diagnostics(self) -> bool:
+        r"""Whether the client pulls diagnostics. If so, diagnostics are not
+        published.
+
+        :param self:
+        :rtype: bool
+        """
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        return (
+            capabilities is not None
+            and capabilities.text_document is not None
+            and capabilities.text_document.diagnostic is not None
+        )
+
+    def get_snapshot(
+        self, uri: str
+    ) -> tuple[Tree, str, DiagnosticCache | None]:
+        r"""Get a snapshot of an open document for linters in other threads.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: tuple[Tree, str, DiagnosticCache | None]
+        """
+        self.documents[uri].store.share()
+        tree = self.trees[uri].copy()
+        path = to_fs_path(uri) or ""
+        cache = (
+            self.diagnostic_caches[uri].copy()
+            if self.incremental_diagnose
+            else None
+        )
+        return tree, path, cache
+
+    def save_diagnostics(
+        self, uri: str, version: int | None, cache: DiagnosticCache | None
+    ) -> bool:
+        r"""Save the diagnostic cache of a snapshot. Return ``False`` if the
+        document has been changed or closed.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param version:
+        :type version: int | None
+        :param cache:
+        :type cache: DiagnosticCache | None
+        :rtype: bool
+        """
+        document = self.documents.get(uri)
+        if document is None or document.version != version:
+            return False
+        if cache is not None:
+            cache.regions = []
+            self.diagnostic_caches[uri] = cache
+        return True
+
+    async def watch_files(self) -> None:
+        r"""Ask the client to watch :attr:`watched_patterns`, then enable the
+        caches of linters and completers depending on files.
+
+        :param self:
+        :rtype: None
+        """
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        workspace = capabilities.workspace if capabilities else None
+        watched_files = (
+            workspace.did_change_watched_files if workspace else None
+        )
+        if not (
+            self.watched_patterns
+            and watched_files
+            and watched_files.dynamic_registration
+        ):
+            return
+        await self.client_register_capability_async(
+            RegistrationParams([
+                Registration(
+                    str(uuid4()),
+                    WORKSPACE_DID_CHANGE_WATCHED_FILES,
+                    DidChangeWatchedFilesRegistrationOptions([
+                        FileSystemWatcher(pattern)
+                        for pattern in self.watched_patterns
+                    ]),
+                )
+            ])
+        )
+        for item in (*self.linters, *self.completers):
+            item.files.enabled = True
+
+    def warm(self) -> None:
+        r"""Build expensive values of linters, such as validators, before the
+        first request.
+
+        :param self:
+        :rtype: None
+        """
+        path = self.workspace.root_path or ""
+        for linter in self.linters:
+            linter.warm(path)
+
+    def invalidate(self, paths: list[str]) -> None:
+        r"""Invalidate the caches depending on changed files, then diagnose
+        the open documents and the files of workspaces depending on them
+        again.
+
+        :param self:
+        :param paths: changed files
+        :type paths: list[str]
+        :rtype: None
+        """
+        documents = self.invalidations.publish(paths)
+        files = self.indexer.invalidate(paths, documents)
+        uris = [
+            uri
+            for uri in self.documents
+            if (to_fs_path(uri) or "") in documents
+        ]
+        for uri in uris:
+            self.results.invalidate(uri)
+            self.diagnostic_caches[uri] = DiagnosticCache()
+            params = DidChangeTextDocumentParams(
+                VersionedTextDocumentIdentifier(
+                    self.documents[uri].version, uri
+                ),
+                [],
+            )
+            self.scheduler.schedule(
+                uri, lambda params=params: self.diagnose(params)
+            )
+        if (uris or files) and self.pull_diagnostics:
+            self.workspace_diagnostic_refresh(None)
+
     def diagnose(
         self,
         params: DidOpenTextDocumentParams | DidChangeTextDocumentParams,
     ) -> None:
-        r"""Publish diagnostics.
+        r"""Publish diagnostics. Linters run in a worker thread on a snapshot
+        of the tree. Skip it if the document has been changed or closed, or
+        the client pulls diagnostics.
 
         :param self:
         :param params:
@@ -237,13 +929,229 @@ class TreeSitterLanguageServer(LanguageServer):
         :rtype: None
         """
         uri = params.text_document.uri
-        tree = self.trees[uri]
+        version = params.text_document.version
+        document = self.documents.get(uri)
+        if (
+            document is None
+            or document.version != version
+            or self.pull_diagnostics
+        ):
+            return
+        tree, path, cache = self.get_snapshot(uri)
+        degraded = document.degraded
+
+        def publish(diagnostics: list[Diagnostic] | None) -> None:
+            if diagnostics is None or not self.save_diagnostics(
+                uri, version, cache
+            ):
+                return
+            self.text_document_publish_diagnostics(
+                PublishDiagnosticsParams(uri, diagnostics, version)
+            )
+
+        def lint(event: Event) -> list[Diagnostic] | None:
+            with (
+                self.profiler.profile(TEXT_DOCUMENT_PUBLISH_DIAGNOSTICS, uri),
+                self.bind(uri, version),
+            ):
+                return self.get_diagnostics(
+                    tree, path, event, cache, degraded, True
+                )
+
+        self.scheduler.submit(uri, lint, publish)
+
+    async def pull_diagnose(
+        self, params: DocumentDiagnosticParams
+    ) -> DocumentDiagnosticReport:
+        r"""Get a diagnostic report. The diagnostics of a document version are
+        computed once when requested. If the client has the same result,
+        report it is unchanged.
+
+        :param self:
+        :param params:
+        :type params: DocumentDiagnosticParams
+        :rtype: DocumentDiagnosticReport
+        """
+        uri = params.text_document.uri
+        document = self.documents.get(uri)
+        if document is None:
+            return RelatedFullDocumentDiagnosticReport([])
+        version = document.version
+        report = self.results.get(uri, version, TEXT_DOCUMENT_DIAGNOSTIC)
+        if report is None:
+            tree, path, cache = self.get_snapshot(uri)
+
+            def lint() -> list[Diagnostic] | None:
+                with (
+                    self.profiler.profile(TEXT_DOCUMENT_DIAGNOSTIC, uri),
+                    self.bind(uri, version),
+                ):
+                    return self.get_diagnostics(
+                        tree, path, None, cache, document.degraded, True
+                    )
+
+            loop = self.scheduler.get_running_loop()
+            if loop is None:
+                diagnostics = lint()
+            else:
+                diagnostics = await loop.run_in_executor(
+                    self.thread_pool, lint
+                )
+            report = RelatedFullDocumentDiagnosticReport(
+                diagnostics or [], result_id=str(next(self.result_ids))
+            )
+            if self.save_diagnostics(uri, version, cache):
+                self.results.set(
+                    uri, version, TEXT_DOCUMENT_DIAGNOSTIC, report
+                )
+        if (
+            report.result_id is not None
+            and report.result_id == params.previous_result_id
+        ):
+            return RelatedUnchangedDocumentDiagnosticReport(report.result_id)
+        return report
+
+    async def workspace_diagnose(
+        self, params: WorkspaceDiagnosticParams
+    ) -> WorkspaceDiagnosticReport:
+        r"""Get diagnostic reports of the files matching
+        :attr:`workspace_patterns` in workspace folders, except open
+        documents. The progress is reported to the client.
+
+        :param self:
+        :param params:
+        :type params: WorkspaceDiagnosticParams
+        :rtype: WorkspaceDiagnosticReport
+        """
+        if not self.workspace_patterns:
+            return WorkspaceDiagnosticReport([])
+        roots = [
+            to_fs_path(folder.uri) or ""
+            for folder in self.workspace.folders.values()
+        ] or [self.workspace.root_path or ""]
+        files = [
+            file
+            for file in self.indexer.get_files(*filter(None, roots))
+            if from_fs_path(file) not in self.documents
+        ]
+        token = params.work_done_token
+        capabilities = getattr(self.protocol, "client_capabilities", None)
+        if (
+            token is None
+            and capabilities is not None
+            and capabilities.window is not None
+            and capabilities.window.work_done_progress
+        ):
+            token = str(uuid4())
+            await self.work_done_progress.create_async(token)
+
+        def report(done: int, total: int) -> None:
+            if token is not None:
+                self.work_done_progress.report(
+                    token,
+                    WorkDoneProgressReport(
+                        message=f"{done}/{total}",
+                        percentage=done * 100 // total if total else 100,
+                    ),
+                )
+
+        if token is not None:
+            self.work_done_progress.begin(
+                token,
+                WorkDoneProgressBegin(f"Indexing {self.name}", percentage=0),
+            )
+        try:
+            entries = await self.indexer.index(files, report)
+        finally:
+            if token is not None:
+                self.work_done_progress.end(token, WorkDoneProgressEnd())
+        result_ids = {
+            result_id.uri: result_id.value
+            for result_id in params.previous_result_ids
+        }
+        items: list[
+            WorkspaceFullDocumentDiagnosticReport
+            | WorkspaceUnchangedDocumentDiagnosticReport
+        ] = []
+        for file, entry in entries.items():
+            uri = from_fs_path(file) or file
+            result_id = entry.get_result_id()
+            if result_ids.get(uri) == result_id:
+                items += [
+                    WorkspaceUnchangedDocumentDiagnosticReport(uri, result_id)
+                ]
+            else:
+                items += [
+                    WorkspaceFullDocumentDiagnosticReport(
+                        uri, entry.diagnostics or [], result_id=result_id
+                    )
+                ]
+        return WorkspaceDiagnosticReport(items)
+
+    def get_diagnostics(
+        self,
+        tree: Tree,
+        path: str,
+        event: Event | None = None,
+        cache: DiagnosticCache | None = None,
+        degraded: bool = False,
+        limited: bool = False,
+    ) -> list[Diagnostic] | None:
+        r"""Get diagnostics.
+
+        :param self:
+        :param tree:
+        :type tree: Tree
+        :param path:
+        :type path: str
+        :param event: return ``None`` when it is set
+        :type event: Event | None
+        :param cache: incremental linters only lint its regions and update
+            its diagnostics
+        :type cache: DiagnosticCache | None
+        :param degraded: skip expensive linters and the diagnostics in the
+            last line of the tree, where the input is ended
+        :type degraded: bool
+        :param limited: apply the policies of linters
+        :type limited: bool
+        :rtype: list[Diagnostic] | None
+        """
         diagnostics = []
-        for linter in self.linters:
-            diagnostics += linter.diagnose(tree, to_fs_path(uri) or "")
-        self.text_document_publish_diagnostics(
-            PublishDiagnosticsParams(uri, diagnostics)
-        )
+        for index, linter in enumerate(self.linters):
+            if event and event.is_set():
+                return None
+            if degraded and linter.expensive:
+                continue
+            action = linter.policy.get_tree_action(tree) if limited else "full"
+            if action != "full":
+                if cache is not None:
+                    cache.diagnostics.pop(index, None)
+                if action == "sample" and linter.incremental:
+                    diagnostics += linter.diagnose(
+                        tree, path, linter.policy.get_ranges()
+                    )
+                continue
+            if cache is None or not linter.incremental:
+                diagnostics += linter.diagnose(tree, path)
+                continue
+            if index in cache.diagnostics:
+                items = cache.update(
+                    index,
+                    linter.diagnose(tree, path, cache.get_byte_ranges()),
+                )
+            else:
+                items = linter.diagnose(tree, path)
+            cache.diagnostics[index] = items
+            diagnostics += items
+        if degraded:
+            # accessing Point.row breaks Node.text later in tree-sitter 0.26
+            row = tuple(tree.root_node.end_point)[0]
+            diagnostics = [
+                diagnostic
+                for diagnostic in diagnostics
+                if diagnostic.range.end.line < row
+            ]
+        return diagnostics
 
     def link(self, params: DocumentLinkParams) -> list[DocumentLink]:
         r"""Get links.
@@ -254,14 +1162,28 @@ class TreeSitterLanguageServer(LanguageServer):
         :rtype: list[DocumentLink]
         """
         uri = params.text_document.uri
-        tree = self.trees[uri]
-        links = []
-        for linter in self.linters:
-            links += linter.link(tree, to_fs_path(uri) or "")
+        version = self.documents[uri].version
+        links = self.results.get(uri, version, TEXT_DOCUMENT_DOCUMENT_LINK)
+        if links is None:
+            tree = self.trees[uri]
+            path = to_fs_path(uri) or ""
+            links = []
+            with self.bind(uri, version):
+                for linter, action in self.get_linters(
+                    tree, self.documents[uri].degraded
+                ):
+                    if action == "full":
+                        links += linter.link(tree, path)
+                    elif linter.incremental:
+                        links += linter.link(
+                            tree, path, linter.policy.get_ranges()
+                        )
+            self.results.set(uri, version, TEXT_DOCUMENT_DOCUMENT_LINK, links)
         return links
 
     def hint(self, params: InlayHintParams) -> list[InlayHint]:
-        r"""Get inlay hints.
+        r"""Get inlay hints. Incremental linters only query the nodes
+        intersecting the requested range.
 
         :param self:
         :param params:
@@ -269,10 +1191,23 @@ class TreeSitterLanguageServer(LanguageServer):
         :rtype: list[InlayHint]
         """
         uri = params.text_document.uri
-        tree = self.trees[uri]
-        hints = []
-        for linter in self.linters:
-            hints += linter.hint(tree, to_fs_path(uri) or "")
+        document = self.documents[uri]
+        ranges = [document.get_byte_range(params.range)]
+        key = TEXT_DOCUMENT_INLAY_HINT, ranges[0]
+        hints = self.results.get(uri, document.version, key)
+        if hints is None:
+            tree = self.trees[uri]
+            path = to_fs_path(uri) or ""
+            hints = []
+            with self.bind(uri, document.version):
+                for linter, action in self.get_linters(
+                    tree, document.degraded
+                ):
+                    if linter.incremental:
+                        hints += linter.hint(tree, path, ranges)
+                    elif action == "full":
+                        hints += linter.hint(tree, path)
+            self.results.set(uri, document.version, key, hints)
         return hints
 
     def symbol(self, params: DocumentSymbolParams) -> list[DocumentSymbol]:
@@ -284,10 +1219,20 @@ class TreeSitterLanguageServer(LanguageServer):
         :rtype: list[DocumentSymbol]
         """
         uri = params.text_document.uri
-        tree = self.trees[uri]
-        symbols = []
-        for linter in self.linters:
-            symbols += linter.symbol(tree, to_fs_path(uri) or "")
+        version = self.documents[uri].version
+        symbols = self.results.get(uri, version, TEXT_DOCUMENT_DOCUMENT_SYMBOL)
+        if symbols is None:
+            tree = self.trees[uri]
+            symbols = []
+            with self.bind(uri, version):
+                for linter, action in self.get_linters(
+                    tree, self.documents[uri].degraded
+                ):
+                    if action == "full":
+                        symbols += linter.symbol(tree, to_fs_path(uri) or "")
+            self.results.set(
+                uri, version, TEXT_DOCUMENT_DOCUMENT_SYMBOL, symbols
+            )
         return symbols
 
     def hover(self, params: TextDocumentPositionParams) -> Hover | None:
@@ -301,6 +1246,8 @@ class TreeSitterLanguageServer(LanguageServer):
         uri = params.text_document.uri
         tree = self.trees[uri]
         for completer in self.completers:
+            if completer.policy.get_tree_action(tree) == "off":
+                continue
             result = completer.hover(
                 tree, params.position, to_fs_path(uri) or ""
             )
@@ -319,6 +1266,8 @@ class TreeSitterLanguageServer(LanguageServer):
         tree = self.trees[uri]
         items = []
         for completer in self.completers:
+            if completer.policy.get_tree_action(tree) == "off":
+                continue
             items += completer.complete(
                 tree, params.position, to_fs_path(uri) or ""
             ).items
@@ -367,44 +1316,184 @@ class TreeSitterLanguageServer(LanguageServer):
                         contents[text] += [content]
         return contents
 
+    def parse(
+        self, document: TreeSitterTextDocument, old_tree: Tree | None = None
+    ) -> Tree:
+        r"""Parse a document with a parser of the pool in
+        :attr:`parse_timeout`. Record the time of parsing and whether the
+        document is degraded.
+
+        :param self:
+        :param document:
+        :type document: TreeSitterTextDocument
+        :param old_tree:
+        :type old_tree: Tree | None
+        :rtype: Tree
+        """
+        degraded = document.degraded
+        start = perf_counter()
+        with self.parsers.checkout() as parser:
+            tree = document.parse(parser, old_tree, self.parse_timeout)
+        document.parse_time = perf_counter() - start
+        metrics.record("parse", document.parse_time)
+        if document.degraded:
+            self.window_log_message(
+                LogMessageParams(
+                    MessageType.Warning,
+                    f"{document.uri}: parsing is cancelled after "
+                    f"{document.parse_time:.3f}s at byte "
+                    f"{tree.root_node.end_byte}",
+                )
+            )
+            if not degraded:
+                self.window_show_message(
+                    ShowMessageParams(
+                        MessageType.Warning,
+                        f"{document.filename} is too large or complex to "
+                        "parse, so only its beginning is linted by cheap "
+                        "linters.",
+                    )
+                )
+        return tree
+
+    def parse_bytes(self, source: bytes) -> tuple[Tree, bool]:
+        r"""Parse a UTF-8 source, such as a file of workspaces, with a parser
+        of the pool in :attr:`parse_timeout`. Return the tree and whether it
+        is degraded.
+
+        :param self:
+        :param source:
+        :type source: bytes
+        :rtype: tuple[Tree, bool]
+        """
+        document = TreeSitterTextDocument.from_bytes("", source)
+        with self.parsers.checkout() as parser, metrics.time("parse"):
+            tree = document.parse(parser, timeout=self.parse_timeout)
+        return tree, document.degraded
+
+    def get_linters(
+        self, tree: Tree, degraded: bool = False
+    ) -> list[tuple[LinterBase, Action]]:
+        r"""Get linters with the actions of their policies for a tree. Skip
+        the linters whose actions are ``off``, and expensive linters for
+        degraded documents.
+
+        :param self:
+        :param tree:
+        :type tree: Tree
+        :param degraded:
+        :type degraded: bool
+        :rtype: list[tuple[LinterBase, Action]]
+        """
+        linters = []
+        for linter in self.linters:
+            if degraded and linter.expensive:
+                continue
+            action = linter.policy.get_tree_action(tree)
+            if action != "off":
+                linters += [(linter, action)]
+        return linters
+
+    def bind(
+        self, uri: str, version: int | None = None, keep: bool = True
+    ) -> AbstractContextManager[None]:
+        r"""Share one pass of the combined query of linters in a block. See
+        :meth:`CaptureDispatcher.bind`.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param version:
+        :type version: int | None
+        :param keep: keep the captures after the block
+        :type keep: bool
+        :rtype: AbstractContextManager[None]
+        """
+        if self.dispatcher is None:
+            return nullcontext()
+        return self.dispatcher.bind(uri, version, keep)
+
+    def get_metrics(self) -> dict[str, dict[str, float]]:
+        r"""Get the latency statistics of handlers and components, and the
+        statistics of the tree store as ``trees``.
+
+        :param self:
+        :rtype: dict[str, dict[str, float]]
+        """
+        return {**metrics.get_stats(), "trees": self.trees.get_stats()}
+
+    def get_policies(self) -> dict[str, Any]:
+        r"""Get the policies of linters and completers, and their actions
+        for open documents.
+
+        :param self:
+        :rtype: dict[str, Any]
+        """
+        items = [*self.linters, *self.completers]
+        return {
+            "policies": {
+                type(item).__name__: asdict(item.policy) for item in items
+            },
+            "documents": {
+                uri: {
+                    "bytes": len(document.store),
+                    "lines": document.store.get_line_count(),
+                    "degraded": document.degraded,
+                    "actions": {
+                        type(item).__name__: item.policy.get_action(
+                            len(document.store),
+                            document.store.get_line_count(),
+                        )
+                        for item in items
+                    },
+                }
+                for uri, document in self.documents.items()
+            },
+        }
+
     def lint(self, *files: str) -> dict[str, list[Diagnostic]]:
-        r"""Lint.
+        r"""Lint. Files are parsed and linted in parallel.
 
         :param self:
         :param files:
         :type files: str
         :rtype: dict[str, list[Diagnostic]]
         """
-        diagnostics: dict[str, list[Diagnostic]] = {}
-        for file in files:
-            diagnostics[file] = []
+
+        def lint(file: str) -> list[Diagnostic]:
             with open(file, "rb") as f:
                 source = f.read()
-            tree = self.parser.parse(source)
-            for linter in self.linters:
-                diagnostics[file] += linter.diagnose(tree, file)
-        return diagnostics
+            tree = self.parsers.parse(source)
+            with self.bind(file, keep=False):
+                return self.get_diagnostics(tree, file) or []
+
+        return dict(zip(files, self.thread_pool.map(lint, files), strict=True))
 
     def instantiate(self, *files: str) -> dict[str, list[dict]]:
-        r"""Instantiate files to JSON data.
+        r"""Instantiate files to JSON data. Files are parsed and instantiated
+        in parallel.
 
         :param self:
         :param files:
         :type files: str
         :rtype: dict[str, list[dict]]
         """
-        instances: dict[str, list[dict]] = {}
-        for file in files:
-            instances[file] = []
+
+        def instantiate(file: str) -> list[dict]:
             with open(file, "rb") as f:
                 source = f.read()
-            tree = self.parser.parse(source)
-            for linter in self.linters:
-                if not isinstance(linter, SchemaLinter):
-                    continue
-                matches = linter.cursor.matches(tree.root_node)
-                instances[file] += [linter.instantiate(matches, NodeText)]
-        return instances
+            tree = self.parsers.parse(source)
+            return [
+                linter.instantiate(
+                    linter.cursor.matches(tree.root_node), NodeText
+                )
+                for linter in self.linters
+                if isinstance(linter, SchemaLinter)
+            ]
+
+        return dict(
+            zip(files, self.thread_pool.map(instantiate, files), strict=True)
+        )
 
     def run(self, args: "Namespace") -> None:
         r"""Run.
@@ -444,10 +1533,23 @@ class TreeSitterLanguageServer(LanguageServer):
         for instances in self.instantiate(*args.convert).values():
             for instance in instances:
                 pprint(instance, args.output_format, color, indent=args.indent)
+        if args.replay:
+            report = SessionReplayer(self, args.replay_speed).run(args.replay)
+            pprint(report, "json", color, indent=args.indent)
+        if args.record:
+            self.recorder = SessionRecorder(self.protocol, args.record)
 
-        if args.tcp:
-            self.start_tcp(args.host, args.port)
-        elif args.ws:
-            self.start_ws(args.host, args.port)
-        if not (args.lookup or args.check or args.convert):
-            self.start_io()
+        try:
+            if args.tcp:
+                self.start_tcp(args.host, args.port)
+            elif args.ws:
+                self.start_ws(args.host, args.port)
+            if not (args.lookup or args.check or args.convert or args.replay):
+                self.start_io()
+        finally:
+            self.indexer.shutdown()
+            if self.recorder is not None:
+                self.recorder.close()
+        if args.metrics:
+            # stdout may be used by the client
+            print(json.dumps(self.get_metrics(), indent=2), file=sys.stderr)
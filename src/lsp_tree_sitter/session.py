@@ -0,0 +1,306 @@
+r"""Session
+===========
+
+Record the messages received by a server and replay them in another server
+to reproduce slow editing sessions.
+"""
+
+import asyncio
+import atexit
+import json
+from time import perf_counter, process_time
+from typing import TYPE_CHECKING, Any
+
+from pygls.protocol import JsonRPCProtocol
+
+from .metrics import Metrics
+
+if TYPE_CHECKING:
+    from .server import TreeSitterLanguageServer
+
+
+class SessionRecorder:
+    r"""Session recorder.
+
+    Each received message is written to a JSON lines file with the seconds
+    since the recorder was created, such as
+    ``{"time": 0.1, "message": {"jsonrpc": "2.0", ...}}``. Lines are flushed
+    immediately, so a crashed session is recorded. The file is closed by
+    :meth:`close`, at the end of a ``with`` block, or at exit.
+    """
+
+    def __init__(self, protocol: JsonRPCProtocol, path: str) -> None:
+        r"""Init.
+
+        :param self:
+        :param protocol:
+        :type protocol: JsonRPCProtocol
+        :param path:
+        :type path: str
+        :rtype: None
+        """
+        self.file = open(path, "w")  # noqa: SIM115
+        self.start = perf_counter()
+        structure_message = protocol.structure_message
+
+        # object hook of json.loads() for every received message
+        def hook(data: dict[str, Any]) -> Any:
+            if "jsonrpc" in data:
+                self.record(data)
+            return structure_message(data)
+
+        protocol.structure_message = hook
+        atexit.register(self.close)
+
+    def __enter__(self) -> "SessionRecorder":
+        r"""Enter.
+
+        :param self:
+        :rtype: SessionRecorder
+        """
+        return self
+
+    def __exit__(self, *args) -> None:
+        r"""Exit.
+
+        :param self:
+        :param args:
+        :rtype: None
+        """
+        self.close()
+
+    def record(self, message: dict[str, Any]) -> None:
+        r"""Record a message.
+
+        :param self:
+        :param message:
+        :type message: dict[str, Any]
+        :rtype: None
+        """
+        # messages after exit aren't recorded
+        if self.file.closed:
+            return
+        self.file.write(
+            json.dumps({
+                "time": perf_counter() - self.start,
+                "message": message,
+            })
+            + "\n"
+        )
+        self.file.flush()
+
+    def close(self) -> None:
+        r"""Close the file. It can be called many times.
+
+        :param self:
+        :rtype: None
+        """
+        self.file.close()
+        atexit.unregister(self.close)
+
+
+class SessionWriter:
+    r"""Writer of a replayed server. It drops the messages sent to the client
+    and responds ``null`` to the requests sent to the client.
+    """
+
+    def __init__(self, protocol: JsonRPCProtocol) -> None:
+        r"""Init.
+
+        :param self:
+        :param protocol:
+        :type protocol: JsonRPCProtocol
+        :rtype: None
+        """
+        self.protocol = protocol
+
+    def respond(self, msg_id: int | str) -> None:
+        r"""Respond a request sent to the client.
+
+        :param self:
+        :param msg_id:
+        :type msg_id: int | str
+        :rtype: None
+        """
+        self.protocol.handle_message(
+            self.protocol.structure_message({
+                "jsonrpc": "2.0",
+                "id": msg_id,
+                "result": None,
+            })
+        )
+
+    def write(self, data: bytes) -> None:
+        r"""Write.
+
+        :param self:
+        :param data:
+        :type data: bytes
+        :rtype: None
+        """
+        message = json.loads(data)
+        if "method" in message and "id" in message:
+            asyncio.get_running_loop().call_soon(self.respond, message["id"])
+
+    def close(self) -> None:
+        r"""Close.
+
+        :param self:
+        :rtype: None
+        """
+
+
+class SessionReplayer:
+    r"""Session replayer.
+
+    Messages recorded by :class:`SessionRecorder` are fed into a server in
+    process. Responses recorded from the client are skipped because the
+    server responds to itself, and ``exit`` is skipped to keep the process.
+    """
+
+    def __init__(
+        self,
+        server: "TreeSitterLanguageServer",
+        speed: float = 0.0,
+        timeout: float = 60.0,
+    ) -> None:
+        r"""Init.
+
+        :param self:
+        :param server: a fresh server
+        :type server: TreeSitterLanguageServer
+        :param speed: 1 is the recorded speed. 0 means without waiting, so
+            the order of jobs is deterministic
+        :type speed: float
+        :param timeout: wait for the last jobs at most this seconds
+        :type timeout: float
+        :rtype: None
+        """
+        self.server = server
+        self.speed = speed
+        self.timeout = timeout
+        self.metrics = Metrics()
+        self.requests: list[dict[str, Any]] = []
+        self.starts: dict[int | str, tuple[str, float]] = {}
+
+    @staticmethod
+    def load(path: str) -> list[tuple[float, str]]:
+        r"""Load the recorded messages. A truncated last line is skipped.
+
+        :param path:
+        :type path: str
+        :rtype: list[tuple[float, str]]
+        """
+        with open(path) as f:
+            texts = [text for text in f if text.strip()]
+        lines = []
+        for i, text in enumerate(texts):
+            try:
+                lines += [json.loads(text)]
+            except ValueError:
+                # the last line of a killed session can be truncated
+                if i < len(texts) - 1:
+                    raise
+        return [
+            (line["time"], json.dumps(line["message"]))
+            for line in lines
+            if "method" in line["message"]
+            and line["message"]["method"] != "exit"
+        ]
+
+    def handle(self, body: str) -> None:
+        r"""Handle a message and record its latency. The latency of a request
+        is recorded when it is responded.
+
+        :param self:
+        :param body:
+        :type body: str
+        :rtype: None
+        """
+        protocol = self.server.protocol
+        message = json.loads(body, object_hook=protocol.structure_message)
+        start = perf_counter()
+        msg_id = getattr(message, "id", None)
+        if msg_id is not None:
+            self.starts[msg_id] = message.method, start
+        protocol.handle_message(message)
+        if msg_id is None:
+            self.metrics.record(message.method, perf_counter() - start)
+
+    def respond(self, msg_id: int | str) -> None:
+        r"""Record the latency of a request.
+
+        :param self:
+        :param msg_id:
+        :type msg_id: int | str
+        :rtype: None
+        """
+        method, start = self.starts.pop(msg_id, ("", 0.0))
+        if not method:
+            return
+        latency = perf_counter() - start
+        self.metrics.record(method, latency)
+        self.requests += [{"id": msg_id, "method": method, "latency": latency}]
+
+    async def wait(self) -> None:
+        r"""Wait for pending requests and scheduled jobs.
+
+        :param self:
+        :rtype: None
+        """
+        scheduler = self.server.scheduler
+        futures = self.server.protocol._request_futures
+        deadline = perf_counter() + self.timeout
+        while perf_counter() < deadline and (
+            self.starts
+            or scheduler.handles
+            or scheduler.jobs
+            or not all(future.done() for future in list(futures.values()))
+        ):
+            await asyncio.sleep(0.01)
+
+    async def replay(self, path: str) -> dict[str, Any]:
+        r"""Replay a session. Return the latencies of requests, the
+        statistics of the latencies of methods, and the total wall time and
+        CPU time.
+
+        :param self:
+        :param path:
+        :type path: str
+        :rtype: dict[str, Any]
+        """
+        protocol = self.server.protocol
+        protocol.set_writer(SessionWriter(protocol), include_headers=False)
+        send_response = protocol._send_response
+
+        def _send_response(msg_id, *args, **kwargs) -> None:
+            self.respond(msg_id)
+            send_response(msg_id, *args, **kwargs)
+
+        protocol._send_response = _send_response
+        wall, cpu = perf_counter(), process_time()
+        for time, body in self.load(path):
+            if self.speed > 0:
+                delay = time / self.speed - (perf_counter() - wall)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.handle(body)
+            # run ready callbacks
+            await asyncio.sleep(0)
+        await self.wait()
+        return {
+            "wall": perf_counter() - wall,
+            "cpu": process_time() - cpu,
+            "requests": self.requests,
+            "methods": self.metrics.get_stats(),
+        }
+
+    def run(self, path: str) -> dict[str, Any]:
+        r"""Replay a session in a new event loop.
+
+        :param self:
+        :param path:
+        :type path: str
+        :rtype: dict[str, Any]
+        """
+        return asyncio.run(self.replay(path))
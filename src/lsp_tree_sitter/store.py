@@ -0,0 +1,698 @@
+r"""Store
+=========
+
+Store the UTF-8 sources and the trees of documents.
+"""
+
+import random
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from math import ceil
+
+from tree_sitter import Point, Tree
+
+
+class TextStore:
+    r"""Text store base."""
+
+    def __len__(self) -> int:
+        r"""Get the number of bytes.
+
+        :param self:
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def __bytes__(self) -> bytes:
+        r"""Materialise the whole source.
+
+        :param self:
+        :rtype: bytes
+        """
+        return self.get_bytes(0, len(self))
+
+    @property
+    def source(self) -> "bytes | bytearray | Callable[[int, Point], bytes]":
+        r"""Source or read callback for ``Parser.parse()``.
+
+        :param self:
+        :rtype: bytes | bytearray | Callable[[int, Point], bytes]
+        """
+        return self.read
+
+    def share(self) -> None:
+        r"""Keep the source referred by the trees parsed before unchanged by
+        later edits, so they can be used in other threads.
+
+        :param self:
+        :rtype: None
+        """
+
+    @staticmethod
+    def get_line_starts(text: bytes | bytearray, offset: int = 0) -> list[int]:
+        r"""Get the byte offsets of the lines started in ``text``. Like tree
+        sitter, only ``\n`` starts a new line.
+
+        :param text:
+        :type text: bytes | bytearray
+        :param offset: the byte offset of ``text``
+        :type offset: int
+        :rtype: list[int]
+        """
+        line_starts = []
+        index = text.find(b"\n")
+        while index != -1:
+            line_starts += [offset + index + 1]
+            index = text.find(b"\n", index + 1)
+        return line_starts
+
+    def get_line_count(self) -> int:
+        r"""Get the number of lines.
+
+        :param self:
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def get_line_start(self, line: int) -> int:
+        r"""Get the byte offset of the start of a line.
+
+        :param self:
+        :param line:
+        :type line: int
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def get_bytes(self, start: int, end: int) -> bytes:
+        r"""Get bytes.
+
+        :param self:
+        :param start:
+        :type start: int
+        :param end:
+        :type end: int
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+    def splice(self, start: int, end: int, data: bytes) -> None:
+        r"""Replace the bytes from ``start`` to ``end`` with ``data``.
+
+        :param self:
+        :param start:
+        :type start: int
+        :param end:
+        :type end: int
+        :param data:
+        :type data: bytes
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    def read(self, byte_offset: int, point: Point | None = None) -> bytes:
+        r"""Read a chunk started at ``byte_offset``.
+
+        :param self:
+        :param byte_offset:
+        :type byte_offset: int
+        :param point:
+        :type point: Point | None
+        :rtype: bytes
+        """
+        return self.get_bytes(byte_offset, len(self))
+
+
+class TextBuffer(TextStore):
+    r"""Store the source in a flat buffer and index the starts of lines."""
+
+    def __init__(self, data: bytes = b"") -> None:
+        r"""Init.
+
+        :param self:
+        :param data:
+        :type data: bytes
+        :rtype: None
+        """
+        self.buffer = bytearray(data)
+        self.line_starts = [0] + self.get_line_starts(self.buffer)
+        self.shared = False
+
+    def __len__(self) -> int:
+        r"""Get the number of bytes.
+
+        :param self:
+        :rtype: int
+        """
+        return len(self.buffer)
+
+    @property
+    def source(self) -> bytearray:
+        r"""Source for ``Parser.parse()``.
+
+        :param self:
+        :rtype: bytearray
+        """
+        return self.buffer
+
+    def share(self) -> None:
+        r"""Copy the buffer before the next edit.
+
+        :param self:
+        :rtype: None
+        """
+        self.shared = True
+
+    def get_line_count(self) -> int:
+        r"""Get the number of lines.
+
+        :param self:
+        :rtype: int
+        """
+        return len(self.line_starts)
+
+    def get_line_start(self, line: int) -> int:
+        r"""Get the byte offset of the start of a line.
+
+        :param self:
+        :param line:
+        :type line: int
+        :rtype: int
+        """
+        return self.line_starts[line]
+
+    def get_bytes(self, start: int, end: int) -> bytes:
+        r"""Get bytes.
+
+        :param self:
+        :param start:
+        :type start: int
+        :param end:
+        :type end: int
+        :rtype: bytes
+        """
+        return bytes(self.buffer[start:end])
+
+    def splice(self, start: int, end: int, data: bytes) -> None:
+        r"""Replace the bytes from ``start`` to ``end`` with ``data``.
+
+        :param self:
+        :param start:
+        :type start: int
+        :param end:
+        :type end: int
+        :param data:
+        :type data: bytes
+        :rtype: None
+        """
+        line_starts = self.line_starts
+        start_line = bisect_right(line_starts, start) - 1
+        end_line = bisect_right(line_starts, end) - 1
+        delta = len(data) - (end - start)
+        if self.shared:
+            self.buffer = self.buffer[:start] + data + self.buffer[end:]
+            self.shared = False
+        else:
+            self.buffer[start:end] = data
+        line_starts[start_line + 1 :] = self.get_line_starts(data, start) + [
+            line_start + delta for line_start in line_starts[end_line + 1 :]
+        ]
+
+
+class RopeNode:
+    r"""A chunk of a rope, which is a node of an implicit treap. Nodes are
+    never modified after creation, so a rope can share them with its old
+    versions.
+    """
+
+    __slots__ = (
+        "chunk",
+        "newlines",
+        "priority",
+        "left",
+        "right",
+        "size",
+        "lines",
+    )
+
+    def __init__(
+        self,
+        chunk: bytes,
+        priority: float | None = None,
+        left: "RopeNode | None" = None,
+        right: "RopeNode | None" = None,
+        newlines: int | None = None,
+    ) -> None:
+        r"""Init.
+
+        :param self:
+        :param chunk:
+        :type chunk: bytes
+        :param priority:
+        :type priority: float | None
+        :param left:
+        :type left: RopeNode | None
+        :param right:
+        :type right: RopeNode | None
+        :param newlines: the number of newlines in ``chunk``
+        :type newlines: int | None
+        :rtype: None
+        """
+        self.chunk = chunk
+        self.newlines = chunk.count(b"\n") if newlines is None else newlines
+        self.priority = random.random() if priority is None else priority
+        self.left = left
+        self.right = right
+        self.size = len(chunk)
+        self.lines = self.newlines
+        for child in (left, right):
+            if child:
+                self.size += child.size
+                self.lines += child.lines
+
+    def replace(
+        self, left: "RopeNode | None", right: "RopeNode | None"
+    ) -> "RopeNode":
+        r"""Copy the node with new children.
+
+        :param self:
+        :param left:
+        :type left: RopeNode | None
+        :param right:
+        :type right: RopeNode | None
+        :rtype: RopeNode
+        """
+        return RopeNode(self.chunk, self.priority, left, right, self.newlines)
+
+
+class TextRope(TextStore):
+    r"""Store the source in a persistent rope. Edits and line lookups cost
+    :math:`O(\log n)` and the parser reads it chunk by chunk, so neither
+    copies the whole source. Edits don't change the source referred by trees
+    parsed before. Chunks are kept between a half and a whole
+    :attr:`chunk_size`, except in a short source.
+    """
+
+    chunk_size: int = 8192
+
+    def __init__(self, data: bytes = b"") -> None:
+        r"""Init.
+
+        :param self:
+        :param data:
+        :type data: bytes
+        :rtype: None
+        """
+        self.root = self.build(data)
+
+    def __len__(self) -> int:
+        r"""Get the number of bytes.
+
+        :param self:
+        :rtype: int
+        """
+        return self.root.size if self.root else 0
+
+    @property
+    def source(self) -> Callable[[int, Point], bytes]:
+        r"""Read callback of the current version for ``Parser.parse()``.
+
+        :param self:
+        :rtype: Callable[[int, Point], bytes]
+        """
+        return self.copy().read
+
+    def copy(self) -> "TextRope":
+        r"""Copy in :math:`O(1)`.
+
+        :param self:
+        :rtype: TextRope
+        """
+        rope = type(self)()
+        rope.root = self.root
+        return rope
+
+    def build(self, data: bytes) -> RopeNode | None:
+        r"""Build a balanced rope.
+
+        :param self:
+        :param data:
+        :type data: bytes
+        :rtype: RopeNode | None
+        """
+        # split data into chunks of the same size
+        number = ceil(len(data) / self.chunk_size)
+        chunks = [
+            data[i * len(data) // number : (i + 1) * len(data) // number]
+            for i in range(number)
+        ]
+
+        def build(start: int, end: int) -> RopeNode | None:
+            if start >= end:
+                return None
+            mid = (start + end) // 2
+            left = build(start, mid)
+            right = build(mid + 1, end)
+            # keep the heap property
+            priority = random.random() + max(
+                (child.priority for child in (left, right) if child),
+                default=0,
+            )
+            return RopeNode(chunks[mid], priority, left, right)
+
+        return build(0, len(chunks))
+
+    @classmethod
+    def split(
+        cls, node: RopeNode | None, offset: int
+    ) -> tuple[RopeNode | None, RopeNode | None]:
+        r"""Split a rope at a byte offset.
+
+        :param cls:
+        :param node:
+        :type node: RopeNode | None
+        :param offset:
+        :type offset: int
+        :rtype: tuple[RopeNode | None, RopeNode | None]
+        """
+        if node is None:
+            return None, None
+        left_size = node.left.size if node.left else 0
+        if offset <= left_size:
+            left, right = cls.split(node.left, offset)
+            return left, node.replace(right, node.right)
+        offset -= left_size
+        if offset >= len(node.chunk):
+            left, right = cls.split(node.right, offset - len(node.chunk))
+            return node.replace(node.left, left), right
+        return (
+            RopeNode(node.chunk[:offset], node.priority, node.left),
+            RopeNode(node.chunk[offset:], node.priority, None, node.right),
+        )
+
+    @classmethod
+    def merge(
+        cls, left: RopeNode | None, right: RopeNode | None
+    ) -> RopeNode | None:
+        r"""Concatenate two ropes.
+
+        :param cls:
+        :param left:
+        :type left: RopeNode | None
+        :param right:
+        :type right: RopeNode | None
+        :rtype: RopeNode | None
+        """
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            return left.replace(left.left, cls.merge(left.right, right))
+        return right.replace(cls.merge(left, right.left), right.right)
+
+    @classmethod
+    def pop_first(cls, node: RopeNode | None) -> tuple[bytes, RopeNode | None]:
+        r"""Split the first chunk off a rope.
+
+        :param cls:
+        :param node:
+        :type node: RopeNode | None
+        :rtype: tuple[bytes, RopeNode | None]
+        """
+        if node is None:
+            return b"", None
+        if node.left is None:
+            return node.chunk, node.right
+        chunk, left = cls.pop_first(node.left)
+        return chunk, node.replace(left, node.right)
+
+    @classmethod
+    def pop_last(cls, node: RopeNode | None) -> tuple[RopeNode | None, bytes]:
+        r"""Split the last chunk off a rope.
+
+        :param cls:
+        :param node:
+        :type node: RopeNode | None
+        :rtype: tuple[RopeNode | None, bytes]
+        """
+        if node is None:
+            return None, b""
+        if node.right is None:
+            return node.left, node.chunk
+        right, chunk = cls.pop_last(node.right)
+        return node.replace(node.left, right), chunk
+
+    def iter_chunks(self, start: int, end: int) -> Iterator[bytes]:
+        r"""Iterate the chunks between two byte offsets.
+
+        :param self:
+        :param start:
+        :type start: int
+        :param end:
+        :type end: int
+        :rtype: Iterator[bytes]
+        """
+        stack: list[tuple[RopeNode, int]] = []
+        node, offset = self.root, 0
+        while stack or node:
+            if node:
+                left_size = node.left.size if node.left else 0
+                stack += [(node, offset + left_size)]
+                # skip the left subtree when it ends before start
+                node = node.left if offset + left_size > start else None
+                continue
+            node, offset = stack.pop()
+            if offset >= end:
+                return
+            chunk_end = offset + len(node.chunk)
+            if chunk_end > start:
+                yield node.chunk[max(start - offset, 0) : end - offset]
+            node, offset = node.right, chunk_end
+
+    def get_line_count(self) -> int:
+        r"""Get the number of lines.
+
+        :param self:
+        :rtype: int
+        """
+        return (self.root.lines if self.root else 0) + 1
+
+    def get_line_start(self, line: int) -> int:
+        r"""Get the byte offset of the start of a line.
+
+        :param self:
+        :param line:
+        :type line: int
+        :rtype: int
+        """
+        if line == 0:
+            return 0
+        node, offset = self.root, 0
+        while node:
+            left_lines = node.left.lines if node.left else 0
+            left_size = node.left.size if node.left else 0
+            if line <= left_lines:
+                node = node.left
+                continue
+            line -= left_lines
+            offset += left_size
+            if line <= node.newlines:
+                index = -1
+                for _ in range(line):
+                    index = node.chunk.index(b"\n", index + 1)
+                return offset + index + 1
+            line -= node.newlines
+            offset += len(node.chunk)
+            node = node.right
+        raise IndexError(line)
+
+    def get_bytes(self, start: int, end: int) -> bytes:
+        r"""Get bytes.
+
+        :param self:
+        :param start:
+        :type start: int
+        :param end:
+        :type end: int
+        :rtype: bytes
+        """
+        return b"".join(self.iter_chunks(start, end))
+
+    def splice(self, start: int, end: int, data: bytes) -> None:
+        r"""Replace the bytes from ``start`` to ``end`` with ``data``.
+
+        :param self:
+        :param start:
+        :type start: int
+        :param end:
+        :type end: int
+        :param data:
+        :type data: bytes
+        :rtype: None
+        """
+        left, right = self.split(self.root, start)
+        _, right = self.split(right, end - start)
+        # rebuild the chunks around the edit with it, otherwise small edits
+        # leave tiny chunks
+        left, before = self.pop_last(left)
+        after, right = self.pop_first(right)
+        data = before + data + after
+        if len(data) < self.chunk_size // 2:
+            if left:
+                left, before = self.pop_last(left)
+                data = before + data
+            elif right:
+                after, right = self.pop_first(right)
+                data += after
+        self.root = self.merge(self.merge(left, self.build(data)), right)
+
+    def read(self, byte_offset: int, point: Point | None = None) -> bytes:
+        r"""Read the chunk containing ``byte_offset``.
+
+        :param self:
+        :param byte_offset:
+        :type byte_offset: int
+        :param point:
+        :type point: Point | None
+        :rtype: bytes
+        """
+        return next(
+            self.iter_chunks(byte_offset, byte_offset + self.chunk_size), b""
+        )
+
+
+class TreeStore:
+    r"""Store trees in a LRU cache bounded by the number of trees and the
+    total bytes of their sources. Evicted trees are parsed again when they
+    are required.
+    """
+
+    def __init__(
+        self,
+        parse: Callable[[str], Tree],
+        max_entries: int = 0,
+        max_bytes: int = 0,
+        evict: Callable[[str], None] | None = None,
+    ) -> None:
+        r"""Init.
+
+        :param self:
+        :param parse: parse the document of a URI
+        :type parse: Callable[[str], Tree]
+        :param max_entries: 0 means unlimited
+        :type max_entries: int
+        :param max_bytes: 0 means unlimited
+        :type max_bytes: int
+        :param evict: called with the URI of an evicted tree
+        :type evict: Callable[[str], None] | None
+        :rtype: None
+        """
+        self.parse = parse
+        self.evict = evict
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.trees: OrderedDict[str, Tree] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, uri: str) -> bool:
+        r"""Judge if a tree is stored.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: bool
+        """
+        return uri in self.trees
+
+    def __len__(self) -> int:
+        r"""Get the number of stored trees.
+
+        :param self:
+        :rtype: int
+        """
+        return len(self.trees)
+
+    def __getitem__(self, uri: str) -> Tree:
+        r"""Get a tree. Parse it if it has been evicted.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: Tree
+        """
+        tree = self.get(uri)
+        if tree is None:
+            tree = self.parse(uri)
+            self[uri] = tree
+        return tree
+
+    def __setitem__(self, uri: str, tree: Tree) -> None:
+        r"""Set a tree and evict the least recently used trees.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :param tree:
+        :type tree: Tree
+        :rtype: None
+        """
+        self.pop(uri)
+        self.trees[uri] = tree
+        self.bytes += tree.root_node.end_byte
+        while len(self.trees) > 1 and (
+            0 < self.max_entries < len(self.trees)
+            or 0 < self.max_bytes < self.bytes
+        ):
+            evicted_uri, evicted = self.trees.popitem(last=False)
+            self.bytes -= evicted.root_node.end_byte
+            self.evictions += 1
+            if self.evict is not None:
+                self.evict(evicted_uri)
+
+    def get(self, uri: str) -> Tree | None:
+        r"""Get a tree. Return ``None`` if it has been evicted.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: Tree | None
+        """
+        tree = self.trees.get(uri)
+        if tree is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.trees.move_to_end(uri)
+        return tree
+
+    def pop(self, uri: str) -> Tree | None:
+        r"""Remove a tree.
+
+        :param self:
+        :param uri:
+        :type uri: str
+        :rtype: Tree | None
+        """
+        tree = self.trees.pop(uri, None)
+        if tree is not None:
+            self.bytes -= tree.root_node.end_byte
+        return tree
+
+    def get_stats(self) -> dict[str, int]:
+        r"""Get statistics.
+
+        :param self:
+        :rtype: dict[str, int]
+        """
+        return {
+            "entries": len(self.trees),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,29 @@
+r"""Test cache."""
+
+from lsp_tree_sitter.cache import ProgramCache
+
+
+def test_program_variables() -> None:
+    r"""Test the variables of programs.
+
+    :rtype: None
+    """
+    programs = ProgramCache()
+    assert programs.input_value(". + $a", 1, {"a": 2}).first() == 3
+    assert programs.input_value(". + $a", 1, {"a": 3}).first() == 4
+    assert len(programs.programs) == 1
+
+
+def test_program_args() -> None:
+    r"""Test ``$ARGS`` of programs.
+
+    :rtype: None
+    """
+    programs = ProgramCache()
+    args = {"a": 2, "b-c": 3}
+    assert programs.input_value("[$ARGS.named, $a, .]", 1, args).first() == [
+        args,
+        2,
+        1,
+    ]
+    assert programs.input_value("$ARGS.named", 1).first() == {}
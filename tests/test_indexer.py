@@ -0,0 +1,109 @@
+r"""Test indexer."""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from tree_sitter import Language, Parser, Query
+
+from lsp_tree_sitter.cache import FileCache
+from lsp_tree_sitter.indexer import WorkspaceIndexer
+from lsp_tree_sitter.linter import PathLinter
+from lsp_tree_sitter.server import TreeSitterLanguageServer
+
+tree_sitter_json = pytest.importorskip("tree_sitter_json")
+
+
+class JSONLanguageServer(TreeSitterLanguageServer):
+    r"""A server whose strings are paths."""
+
+    workspace_patterns = ("*.json",)
+
+    def __init__(self, *args, **kwargs) -> None:
+        r"""Init.
+
+        :param self:
+        :param args:
+        :param kwargs:
+        :rtype: None
+        """
+        language = Language(tree_sitter_json.language())
+        query = Query(language, "(string_content) @string.special.path")
+        super().__init__(
+            Parser(language), (PathLinter(query),), (), *args, **kwargs
+        )
+
+
+def index(indexer: WorkspaceIndexer, root: str) -> dict[str, list[str]]:
+    r"""Index the files of a workspace. Return their diagnostic messages.
+
+    :param indexer:
+    :type indexer: WorkspaceIndexer
+    :param root:
+    :type root: str
+    :rtype: dict[str, list[str]]
+    """
+    files = indexer.get_files(root)
+    entries = asyncio.run(indexer.index(files))
+    return {
+        file: [diagnostic.message for diagnostic in entry.diagnostics or []]
+        for file, entry in entries.items()
+    }
+
+
+def test_index(tmp_path) -> None:
+    r"""Test indexing files in worker processes and invalidating the files
+    depending on changed files.
+
+    :param tmp_path:
+    :rtype: None
+    """
+    server = JSONLanguageServer(version="0")
+    (tmp_path / "a.json").write_text('["b.json"]')
+    (tmp_path / "b.json").write_text('["c.json"]')
+    (tmp_path / "d.json").write_text("[]")
+    indexer = WorkspaceIndexer(server, FileCache(), 2)
+    try:
+        assert index(indexer, str(tmp_path)) == {
+            str(tmp_path / "a.json"): [],
+            str(tmp_path / "b.json"): [
+                "invalid path " + str(tmp_path / "c.json")
+            ],
+            str(tmp_path / "d.json"): [],
+        }
+        assert isinstance(indexer.executor, ProcessPoolExecutor)
+        (tmp_path / "c.json").write_text("[]")
+        assert indexer.invalidate([str(tmp_path / "c.json")], set()) == {
+            str(tmp_path / "b.json")
+        }
+        # the worker processes cached that c.json doesn't exist
+        assert indexer.executor is None
+        assert index(indexer, str(tmp_path))[str(tmp_path / "b.json")] == []
+    finally:
+        indexer.shutdown()
+
+
+def test_index_in_threads(tmp_path) -> None:
+    r"""Test indexing files in threads when worker processes cannot create
+    the server.
+
+    :param tmp_path:
+    :rtype: None
+    """
+    language = Language(tree_sitter_json.language())
+    query = Query(language, "(string_content) @string.special.path")
+    server = TreeSitterLanguageServer(
+        Parser(language), (PathLinter(query),), (), version="0"
+    )
+    server.workspace_patterns = ("*.json",)
+    (tmp_path / "a.json").write_text('["b.json"]')
+    indexer = WorkspaceIndexer(server, FileCache(), 1)
+    try:
+        assert index(indexer, str(tmp_path)) == {
+            str(tmp_path / "a.json"): [
+                "invalid path " + str(tmp_path / "b.json")
+            ]
+        }
+        assert isinstance(indexer.executor, ThreadPoolExecutor)
+    finally:
+        indexer.shutdown()
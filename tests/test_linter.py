@@ -0,0 +1,206 @@
+r"""Test linter."""
+
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from tree_sitter import Language, Node, Parser, Query, QueryCursor
+
+from lsp_tree_sitter.linter import CaptureDispatcher, PathLinter, SchemaLinter
+from lsp_tree_sitter.node import NodeText, NodeTuples
+
+tree_sitter_json = pytest.importorskip("tree_sitter_json")
+
+DOCUMENT = b"""{
+  "name": "x",
+  "size": "12",
+  "flag": "no",
+  "tags": ["a", "b"],
+  "child": {"size": "3", "path": "/tmp"}
+}
+"""
+QUERIES = {
+    "key": "(pair key: (string (string_content) @--key) value: (_) @-key)",
+    "integer": """(pair
+  key: (string (string_content) @--key)
+  value: (string (string_content) @-key.--integer))""",
+    "boolean": """(pair
+  key: (string (string_content) @--key)
+  value: (string (string_content) @-key.--boolean-no))""",
+    "append": "(array (string (string_content) @items.-))",
+    "update": "(string (string_content) @values.--)",
+    "nested": """(pair
+  key: (string (string_content) @--parent)
+  value: (object
+    (pair key: (string (string_content) @--key) value: (_) @-parent.-key)))""",
+    "default": """((pair key: (string (string_content) @pairs.-.key))
+  (#set! "pairs.-.kind" "pair")
+  (#set! "pairs.-.count.--integer" "1"))""",
+}
+TEXT_INSTANCES = {
+    "key": {
+        "name": '"x"',
+        "size": '"3"',
+        "flag": '"no"',
+        "tags": '["a", "b"]',
+        "child": '{"size": "3", "path": "/tmp"}',
+        "path": '"/tmp"',
+    },
+    "integer": {"name": "x", "size": 3, "flag": "no", "path": "/tmp"},
+    "boolean": {"name": True, "size": True, "flag": False, "path": True},
+    "append": {"items": ["a", "b"]},
+    "update": {
+        "values": [
+            *("name", "x", "size", "12", "flag", "no", "tags", "a", "b"),
+            *("child", "size", "3", "path", "/tmp"),
+        ]
+    },
+    "nested": {"child": {"size": '"3"', "path": '"/tmp"'}},
+    "default": {
+        "pairs": [
+            {"key": key, "kind": "pair", "count": 1}
+            for key in ("name", "size", "flag", "tags", "child", "size")
+            + ("path",)
+        ]
+    },
+}
+
+
+def instantiate(
+    name: str, callback: Callable[[Node], Any], use_jq: bool
+) -> Any:
+    r"""Instantiate :data:`DOCUMENT` by a query of :data:`QUERIES`.
+
+    :param name:
+    :type name: str
+    :param callback:
+    :type callback: Callable[[Node], Any]
+    :param use_jq:
+    :type use_jq: bool
+    :rtype: Any
+    """
+    language = Language(tree_sitter_json.language())
+    query = Query(language, QUERIES[name])
+    tree = Parser(language).parse(DOCUMENT)
+    linter = SchemaLinter(query, lambda _: None, use_jq=use_jq)
+    return linter.instantiate(
+        QueryCursor(query).matches(tree.root_node), callback
+    )
+
+
+@pytest.mark.parametrize("use_jq", [False, True])
+@pytest.mark.parametrize("name", QUERIES)
+def test_instantiate(name: str, use_jq: bool) -> None:
+    r"""Test instantiation of texts.
+
+    :param name:
+    :type name: str
+    :param use_jq:
+    :type use_jq: bool
+    :rtype: None
+    """
+    assert instantiate(name, NodeText, use_jq) == TEXT_INSTANCES[name]
+
+
+@pytest.mark.parametrize("use_jq", [False, True])
+def test_instantiate_tuples(use_jq: bool) -> None:
+    r"""Test instantiation of ranges.
+
+    :param use_jq:
+    :type use_jq: bool
+    :rtype: None
+    """
+    assert instantiate("append", NodeTuples, use_jq) == {
+        "items": [[[4, 12], [4, 13]], [[4, 17], [4, 18]]]
+    }
+
+
+@pytest.mark.parametrize("callback", [NodeText, NodeTuples])
+@pytest.mark.parametrize("name", QUERIES)
+def test_engines(name: str, callback: Callable[[Node], Any]) -> None:
+    r"""Test python and jq get the same instance.
+
+    :param name:
+    :type name: str
+    :param callback:
+    :type callback: Callable[[Node], Any]
+    :rtype: None
+    """
+    assert instantiate(name, callback, False) == instantiate(
+        name, callback, True
+    )
+
+
+@pytest.mark.parametrize("use_jq", [False, True])
+def test_instantiate_all(use_jq: bool) -> None:
+    r"""Test instantiation of texts and ranges in one pass.
+
+    :param use_jq:
+    :type use_jq: bool
+    :rtype: None
+    """
+    language = Language(tree_sitter_json.language())
+    query = Query(language, QUERIES["default"])
+    tree = Parser(language).parse(DOCUMENT)
+    linter = SchemaLinter(query, lambda _: None, use_jq=use_jq)
+    matches = QueryCursor(query).matches(tree.root_node)
+    assert linter.instantiate_all(matches, [NodeText, NodeTuples]) == [
+        linter.instantiate(matches, NodeText),
+        linter.instantiate(matches, NodeTuples),
+    ]
+
+
+def get_ranges(captures: dict[str, list[Node]]) -> dict[str, list[tuple]]:
+    r"""Get the sorted byte ranges of captures.
+
+    :param captures:
+    :type captures: dict[str, list[Node]]
+    :rtype: dict[str, list[tuple]]
+    """
+    return {
+        label: sorted((node.start_byte, node.end_byte) for node in nodes)
+        for label, nodes in captures.items()
+    }
+
+
+def test_dispatch() -> None:
+    r"""Test linters sharing one query get the same captures as running
+    their queries separately, and a new version of a document gets new
+    captures.
+
+    :rtype: None
+    """
+    language = Language(tree_sitter_json.language())
+    texts = [
+        "(string (string_content) @string.special.path)",
+        "(pair key: (string) @key value: (string) @string.special.path)",
+        """(array (string) @item)
+(number) @number""",
+    ]
+    linters = []
+    for text in texts:
+        linter = PathLinter(Query(language, text))
+        linter.text = text
+        linters += [linter]
+    tree = Parser(language).parse(DOCUMENT)
+    expected = [get_ranges(linter.get_captures(tree)) for linter in linters]
+    dispatcher = CaptureDispatcher.from_linters(language, tuple(linters))
+    assert dispatcher is not None
+    with dispatcher.bind("file:///a.json", 1):
+        assert [
+            get_ranges(linter.get_captures(tree)) for linter in linters
+        ] == expected
+        captures = linters[0].get_captures(tree)
+        # the combined query runs once
+        assert linters[0].get_captures(tree) is captures
+    assert list(dispatcher.captures) == ["file:///a.json"]
+    # not bound
+    assert dispatcher.get_captures(linters[0], tree) is None
+    source = DOCUMENT.replace(b'"x"', b'"xyz", "n": 1')
+    tree = Parser(language).parse(source)
+    with dispatcher.bind("file:///a.json", 2):
+        captures = get_ranges(linters[2].get_captures(tree))
+    assert captures == get_ranges(linters[2].cursor.captures(tree.root_node))
+    assert captures["number"] == [(source.index(b"1"), source.index(b"1") + 1)]
+    dispatcher.pop("file:///a.json")
+    assert dispatcher.captures == {}
@@ -0,0 +1,48 @@
+r"""Test profiler."""
+
+import os
+import tracemalloc
+from threading import Event, Thread
+
+from lsp_tree_sitter.profiler import Profiler
+
+
+def test_profile_concurrently(tmp_path) -> None:
+    r"""Test two blocks profiled at the same time.
+
+    :param tmp_path:
+    :rtype: None
+    """
+    profiler = Profiler(str(tmp_path), 2)
+    entered = Event()
+    done = Event()
+
+    def profile() -> None:
+        r"""Profile a block until the main thread has profiled another.
+
+        :rtype: None
+        """
+        with profiler.profile("worker"):
+            entered.set()
+            done.wait(10)
+
+    thread = Thread(target=profile)
+    thread.start()
+    assert entered.wait(10)
+    try:
+        with profiler.profile("main"):
+            pass
+    finally:
+        done.set()
+        thread.join()
+    assert not profiler.active
+    assert not tracemalloc.is_tracing()
+    # the overlapping block doesn't consume the count
+    assert profiler.count == 1
+    names = os.listdir(tmp_path)
+    assert len(names) == 2
+    assert all("worker" in name for name in names)
+    with profiler.profile("main"):
+        pass
+    assert profiler.count == 0
+    assert len(os.listdir(tmp_path)) == 4
@@ -0,0 +1,71 @@
+r"""Test scheduler."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+from lsp_tree_sitter.scheduler import Scheduler
+
+
+def test_schedule() -> None:
+    r"""Test a job scheduled for a URI replaces its pending job, and
+    cancelling a URI drops its pending job.
+
+    :rtype: None
+    """
+    scheduler = Scheduler(0.01)
+    calls = []
+
+    async def main() -> None:
+        scheduler.schedule("a", lambda: calls.append("a1"))
+        scheduler.schedule("b", lambda: calls.append("b1"))
+        scheduler.schedule("a", lambda: calls.append("a2"))
+        scheduler.schedule("c", lambda: calls.append("c1"))
+        scheduler.cancel("c")
+        await asyncio.sleep(0.1)
+
+    asyncio.run(main())
+    assert sorted(calls) == ["a2", "b1"]
+    assert scheduler.handles == {}
+
+
+def test_cancel() -> None:
+    r"""Test cancelling the queued job and the running job of a URI.
+
+    :rtype: None
+    """
+    executor = ThreadPoolExecutor(1)
+    scheduler = Scheduler(0.0, executor)
+    started = Event()
+    release = Event()
+    calls = []
+    results = []
+
+    def run(event: Event) -> str:
+        calls.append("run")
+        started.set()
+        release.wait(10)
+        return "run"
+
+    def queued(event: Event) -> str:
+        calls.append("queued")
+        return "queued"
+
+    async def main() -> None:
+        scheduler.submit("a", run, results.append)
+        # the only worker is busy, so the job of b is queued
+        scheduler.submit("b", queued, results.append)
+        assert await asyncio.to_thread(started.wait, 10)
+        scheduler.cancel("b")
+        scheduler.cancel("a")
+        release.set()
+        await asyncio.to_thread(executor.shutdown)
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        executor.shutdown()
+    assert calls == ["run"]
+    assert results == []
+    assert scheduler.jobs == {}
@@ -0,0 +1,322 @@
+r"""Test server."""
+
+import asyncio
+import json
+import random
+from typing import Any
+
+import pytest
+from lsprotocol.types import WORKSPACE_EXECUTE_COMMAND
+from pygls.uris import from_fs_path
+
+from lsp_tree_sitter.linter import PathLinter
+from lsp_tree_sitter.server import (
+    TreeSitterLanguageServer,
+    TreeSitterTextDocument,
+)
+
+tree_sitter_json = pytest.importorskip("tree_sitter_json")
+
+
+class Writer:
+    r"""Collect the messages sent by a server."""
+
+    def __init__(self) -> None:
+        r"""Init.
+
+        :param self:
+        :rtype: None
+        """
+        self.messages: list[dict[str, Any]] = []
+
+    def write(self, data: bytes) -> None:
+        r"""Write.
+
+        :param self:
+        :param data:
+        :type data: bytes
+        :rtype: None
+        """
+        self.messages += [json.loads(data)]
+
+    def close(self) -> None:
+        r"""Close.
+
+        :param self:
+        :rtype: None
+        """
+
+
+@pytest.fixture
+def server(tmp_path) -> TreeSitterLanguageServer:
+    r"""Server.
+
+    :param tmp_path:
+    :rtype: TreeSitterLanguageServer
+    """
+    from tree_sitter import Language, Parser
+
+    server = TreeSitterLanguageServer(
+        Parser(Language(tree_sitter_json.language())), (), (), version="0"
+    )
+    server.profiler.directory = str(tmp_path)
+    return server
+
+
+def execute_command(
+    server: TreeSitterLanguageServer, command: str, arguments: list
+) -> dict[str, Any]:
+    r"""Execute a command through the protocol. Return the response.
+
+    :param server:
+    :type server: TreeSitterLanguageServer
+    :param command:
+    :type command: str
+    :param arguments:
+    :type arguments: list
+    :rtype: dict[str, Any]
+    """
+    writer = Writer()
+    protocol = server.protocol
+
+    async def main() -> None:
+        protocol.set_writer(writer, include_headers=False)
+        message = json.dumps({
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": WORKSPACE_EXECUTE_COMMAND,
+            "params": {
+                "command": server.get_command(command),
+                "arguments": arguments,
+            },
+        })
+        protocol.handle_message(
+            json.loads(message, object_hook=protocol.structure_message)
+        )
+        while not writer.messages:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(asyncio.wait_for(main(), 10))
+    return writer.messages[0]
+
+
+@pytest.mark.parametrize(
+    "arguments, count, threshold",
+    [([], 1, 0.0), ([5], 5, 0.0), ([0, 0.5], 0, 0.5)],
+)
+def test_profile_optional_arguments(
+    server: TreeSitterLanguageServer,
+    arguments: list,
+    count: int,
+    threshold: float,
+) -> None:
+    r"""Test the optional arguments of the profile command.
+
+    :param server:
+    :type server: TreeSitterLanguageServer
+    :param arguments:
+    :type arguments: list
+    :param count:
+    :type count: int
+    :param threshold:
+    :type threshold: float
+    :rtype: None
+    """
+    directory = server.profiler.directory
+    response = execute_command(server, "profile", arguments)
+    assert response["result"] == {
+        "directory": directory,
+        "count": count,
+        "threshold": threshold,
+    }
+
+
+def test_profile_too_many_arguments(server: TreeSitterLanguageServer) -> None:
+    r"""Test the profile command with too many arguments.
+
+    :param server:
+    :type server: TreeSitterLanguageServer
+    :rtype: None
+    """
+    response = execute_command(server, "profile", [1, 0.0, "", 0])
+    assert "error" in response
+
+
+def test_parse_partially(server: TreeSitterLanguageServer) -> None:
+    r"""Test a document parsed out of the budget keeps the tree of the
+    source read in time.
+
+    :param server:
+    :type server: TreeSitterLanguageServer
+    :rtype: None
+    """
+    source = "[\n" + ",\n".join(f'"{i}"' for i in range(100000)) + "\n]\n"
+    document = TreeSitterTextDocument("file:///test.json", source)
+    with server.parsers.checkout() as parser:
+        tree = document.parse(parser, timeout=1e-6)
+        assert document.degraded
+        end = tree.root_node.end_byte
+        assert 0 <= end < len(source)
+        assert tree.root_node.text == source[:end].encode()
+        tree = document.parse(parser)
+    assert not document.degraded
+    assert tree.root_node.end_byte == len(source)
+
+
+def test_share_documents(server: TreeSitterLanguageServer) -> None:
+    r"""Test the workspace shares open documents with the server.
+
+    :param server:
+    :type server: TreeSitterLanguageServer
+    :rtype: None
+    """
+    protocol = server.protocol
+    protocol.set_writer(Writer(), include_headers=False)
+    uri = "file:///test.json"
+    for message in (
+        {"id": 1, "method": "initialize", "params": {"capabilities": {}}},
+        {
+            "method": "textDocument/didOpen",
+            "params": {
+                "textDocument": {
+                    "uri": uri,
+                    "languageId": "json",
+                    "version": 0,
+                    "text": '{"a": 1}\n',
+                }
+            },
+        },
+        {
+            "method": "textDocument/didChange",
+            "params": {
+                "textDocument": {"uri": uri, "version": 1},
+                "contentChanges": [
+                    {
+                        "range": {
+                            "start": {"line": 0, "character": 6},
+                            "end": {"line": 0, "character": 7},
+                        },
+                        "text": "23",
+                    }
+                ],
+            },
+        },
+    ):
+        protocol.handle_message(
+            json.loads(
+                json.dumps({"jsonrpc": "2.0", **message}),
+                object_hook=protocol.structure_message,
+            )
+        )
+    document = server.workspace.get_text_document(uri)
+    assert document is server.documents[uri]
+    assert document.source == '{"a": 23}\n'
+    assert server.trees[uri].root_node.text == b'{"a": 23}\n'
+
+
+def test_metrics(server: TreeSitterLanguageServer) -> None:
+    r"""Test the metrics command reports the statistics of trees.
+
+    :param server:
+    :type server: TreeSitterLanguageServer
+    :rtype: None
+    """
+    response = execute_command(server, "metrics", [])
+    assert response["result"]["trees"] == server.trees.get_stats()
+
+
+def get_position(text: str, offset: int) -> dict[str, int]:
+    r"""Get the LSP position of an offset of an ASCII text.
+
+    :param text:
+    :type text: str
+    :param offset:
+    :type offset: int
+    :rtype: dict[str, int]
+    """
+    line = text.count("\n", 0, offset)
+    return {
+        "line": line,
+        "character": offset - text.rfind("\n", 0, offset) - 1,
+    }
+
+
+def test_incremental_diagnose(tmp_path) -> None:
+    r"""Test random edits get the same diagnostics by incremental linters
+    as by linting the whole document.
+
+    :param tmp_path:
+    :rtype: None
+    """
+    from tree_sitter import Language, Parser, Query
+
+    language = Language(tree_sitter_json.language())
+    query = Query(language, "(string_content) @string.special.path")
+    server = TreeSitterLanguageServer(
+        Parser(language), (PathLinter(query),), (), version="0"
+    )
+    server.incremental_diagnose = True
+    writer = Writer()
+    protocol = server.protocol
+    protocol.set_writer(writer, include_headers=False)
+    (tmp_path / "a.json").write_text("")
+    path = str(tmp_path / "test.json")
+    uri = from_fs_path(path)
+    text = '[\n  "a.json",\n  "b.json",\n  {"c": "a.json"}\n]\n'
+
+    def send(message: dict[str, Any]) -> None:
+        protocol.handle_message(
+            json.loads(
+                json.dumps({"jsonrpc": "2.0", **message}),
+                object_hook=protocol.structure_message,
+            )
+        )
+
+    def check() -> None:
+        diagnostics = writer.messages[-1]["params"]["diagnostics"]
+        tree = Parser(language).parse(text.encode())
+        expected = [
+            json.loads(json.dumps(protocol._converter.unstructure(diagnostic)))
+            for diagnostic in server.get_diagnostics(tree, path) or []
+        ]
+        assert sorted(diagnostics, key=json.dumps) == sorted(
+            expected, key=json.dumps
+        )
+
+    send({"id": 1, "method": "initialize", "params": {"capabilities": {}}})
+    send({
+        "method": "textDocument/didOpen",
+        "params": {
+            "textDocument": {
+                "uri": uri,
+                "languageId": "json",
+                "version": 0,
+                "text": text,
+            }
+        },
+    })
+    check()
+    random.seed(0)
+    pieces = ['"a.json", ', '"b.json", ', '"x', "a", "\n", ",", " ", ""]
+    for version in range(1, 200):
+        start = random.randint(0, len(text))
+        end = random.randint(start, min(start + 8, len(text)))
+        new_text = random.choice(pieces)
+        send({
+            "method": "textDocument/didChange",
+            "params": {
+                "textDocument": {"uri": uri, "version": version},
+                "contentChanges": [
+                    {
+                        "range": {
+                            "start": get_position(text, start),
+                            "end": get_position(text, end),
+                        },
+                        "text": new_text,
+                    }
+                ],
+            },
+        })
+        text = text[:start] + new_text + text[end:]
+        assert server.documents[uri].source == text
+        check()
@@ -0,0 +1,39 @@
+r"""Test session."""
+
+import json
+
+from pygls.protocol import JsonRPCProtocol, default_converter
+
+from lsp_tree_sitter.session import SessionRecorder, SessionReplayer
+
+
+def test_record(tmp_path) -> None:
+    r"""Test recording messages until the recorder is closed.
+
+    :param tmp_path:
+    :rtype: None
+    """
+    path = tmp_path / "session.jsonl"
+    protocol = JsonRPCProtocol(None, default_converter())
+    with SessionRecorder(protocol, str(path)) as recorder:
+        recorder.record({"jsonrpc": "2.0", "method": "initialized"})
+        # flushed before closing
+        assert len(path.read_text().splitlines()) == 1
+    recorder.record({"jsonrpc": "2.0", "method": "exit"})
+    recorder.close()
+    assert len(path.read_text().splitlines()) == 1
+
+
+def test_load_truncated(tmp_path) -> None:
+    r"""Test loading a session whose last line is truncated.
+
+    :param tmp_path:
+    :rtype: None
+    """
+    path = tmp_path / "session.jsonl"
+    line = json.dumps({
+        "time": 0.0,
+        "message": {"jsonrpc": "2.0", "method": "initialized"},
+    })
+    path.write_text(line + "\n" + line[:20])
+    assert len(SessionReplayer.load(str(path))) == 1
@@ -0,0 +1,151 @@
+r"""Test store."""
+
+import random
+
+import pytest
+from tree_sitter import Language, Parser
+
+from lsp_tree_sitter.store import TextBuffer, TextRope, TextStore, TreeStore
+
+
+class SmallTextRope(TextRope):
+    r"""A rope of small chunks to test many chunks."""
+
+    chunk_size = 16
+
+
+def check(store: TextStore, data: bytes) -> None:
+    r"""Check a store has the same bytes and lines as ``data``.
+
+    :param store:
+    :type store: TextStore
+    :param data:
+    :type data: bytes
+    :rtype: None
+    """
+    assert len(store) == len(data)
+    assert bytes(store) == data
+    lines = data.split(b"\n")
+    assert store.get_line_count() == len(lines)
+    start = 0
+    for line, text in enumerate(lines):
+        assert store.get_line_start(line) == start
+        start += len(text) + 1
+    for _ in range(10):
+        start = random.randint(0, len(data))
+        end = random.randint(start, len(data))
+        assert store.get_bytes(start, end) == data[start:end]
+        chunk = store.read(start)
+        assert chunk == data[start : start + len(chunk)]
+        assert chunk or start == len(data)
+
+
+@pytest.mark.parametrize("cls", [TextBuffer, TextRope, SmallTextRope])
+def test_splice(cls: type[TextStore]) -> None:
+    r"""Test random splices like slicing bytes.
+
+    :param cls:
+    :type cls: type[TextStore]
+    :rtype: None
+    """
+    random.seed(0)
+    data = b"".join(
+        random.choice([b"a", b"bc", b"\n", "é".encode()]) for _ in range(500)
+    )
+    store = cls(data)
+    check(store, data)
+    for _ in range(300):
+        start = random.randint(0, len(data))
+        end = random.randint(start, min(start + 10, len(data)))
+        text = random.choice([b"", b"x", b"\n", b"yz\n", b"w" * 40])
+        store.splice(start, end, text)
+        data = data[:start] + text + data[end:]
+        check(store, data)
+
+
+def test_chunks() -> None:
+    r"""Test single character edits don't leave tiny chunks.
+
+    :rtype: None
+    """
+    random.seed(0)
+    data = b"x" * 1000
+    rope = SmallTextRope(data)
+    for _ in range(1000):
+        start = random.randint(0, len(data))
+        if random.random() < 0.5 and start < len(data):
+            rope.splice(start, start + 1, b"")
+            data = data[:start] + data[start + 1 :]
+        else:
+            rope.splice(start, start, b"y")
+            data = data[:start] + b"y" + data[start:]
+    check(rope, data)
+    chunks = list(rope.iter_chunks(0, len(rope)))
+    assert all(len(chunk) >= rope.chunk_size // 2 for chunk in chunks)
+    assert all(len(chunk) <= rope.chunk_size for chunk in chunks)
+
+
+def test_copy() -> None:
+    r"""Test a copy keeps the old version of a rope.
+
+    :rtype: None
+    """
+    rope = SmallTextRope(b"0123456789" * 10)
+    read = rope.source
+    rope.splice(0, 50, b"")
+    assert bytes(rope) == b"0123456789" * 5
+    chunk = read(0, None)  # type: ignore
+    assert chunk
+    assert chunk == (b"0123456789" * 10)[: len(chunk)]
+
+
+@pytest.mark.parametrize(
+    "max_entries, max_bytes, uris, hits",
+    [
+        (2, 0, ["a", "c"], 1),
+        (0, 25, ["a", "c"], 1),
+        (0, 5, ["c"], 0),
+        (0, 0, ["a", "b", "c"], 1),
+    ],
+)
+def test_evict(
+    max_entries: int, max_bytes: int, uris: list[str], hits: int
+) -> None:
+    r"""Test evicting the least recently used trees out of the limits.
+
+    :param max_entries:
+    :type max_entries: int
+    :param max_bytes:
+    :type max_bytes: int
+    :param uris: the URIs of the trees left
+    :type uris: list[str]
+    :param hits:
+    :type hits: int
+    :rtype: None
+    """
+    tree_sitter_json = pytest.importorskip("tree_sitter_json")
+    parser = Parser(Language(tree_sitter_json.language()))
+    sources = {"a": b'["a", "a"]', "b": b'["b", "b"]', "c": b'["c", "c"]'}
+    evicted: list[str] = []
+    trees = TreeStore(
+        lambda uri: parser.parse(sources[uri]),
+        max_entries,
+        max_bytes,
+        evicted.append,
+    )
+    trees["a"] = parser.parse(sources["a"])
+    trees["b"] = parser.parse(sources["b"])
+    # b becomes the least recently used tree
+    trees.get("a")
+    trees["c"] = parser.parse(sources["c"])
+    assert list(trees.trees) == [uri for uri in "bac" if uri in uris]
+    assert trees.get_stats() == {
+        "entries": len(uris),
+        "bytes": 10 * len(uris),
+        "hits": hits,
+        "misses": 1 - hits,
+        "evictions": 3 - len(uris),
+    }
+    assert sorted(evicted) == sorted(set("abc") - set(uris))
+    # evicted trees are parsed again
+    assert trees["b"].root_node.text == sources["b"]